@@ -0,0 +1,124 @@
+"""Server-side stacking of the deaths-by-age area chart.
+
+The area chart shows each age group's share of a year's smoking deaths,
+stacked to 100%. Rather than shipping the long data and letting Vega-Lite
+normalize it after every brush change, the shares and their cumulative stack
+offsets are computed here, once, in NumPy straight from the wide
+smoking-deaths-by-age table. The chart then draws ready-made bands (``lower``
+to ``upper``) and the brush only slices years.
+"""
+import startup
+import loaders
+
+np = startup.lazy_import('numpy')
+pd = startup.lazy_import('pandas')
+
+
+def stack_arrays(deaths):
+    """Totals, shares and stack offsets of a wide deaths-by-age frame.
+
+    Returns the ``(country, year)`` keys as two arrays and ``totals`` (rows),
+    ``shares``, ``lower`` and ``upper`` (rows x age groups) as NumPy arrays,
+    in the row order of ``deaths`` sorted by country and year.
+    """
+    deaths = deaths.sort_values(['country', 'year'], kind='mergesort')
+    values = deaths.loc[:, loaders.AGE_GROUPS].to_numpy(dtype='float64')
+    values = np.nan_to_num(values)
+    totals = values.sum(axis=1)
+    # A year without any death has no shares to draw
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shares = np.where(totals[:, None] > 0, values / totals[:, None], 0.0)
+    upper = np.cumsum(shares, axis=1)
+    return {'country': deaths['country'].to_numpy(),
+            'year': deaths['year'].to_numpy(),
+            'totals': totals,
+            'shares': shares,
+            'lower': upper - shares,
+            'upper': upper}
+
+
+def stack_frames(stack, rows=slice(None)):
+    """``(bands, totals)`` frames of the ``rows`` of a ``stack_arrays`` result.
+
+    ``bands`` has one row per year and age group with ``share``, ``lower`` and
+    ``upper``; ``totals`` has one row per year with the deaths of all ages.
+    """
+    years = stack['year'][rows]
+    groups = len(loaders.AGE_GROUPS)
+    bands = pd.DataFrame({'year': np.repeat(years, groups),
+                          'Age': np.tile(loaders.AGE_GROUPS, len(years)),
+                          'share': stack['shares'][rows].ravel(),
+                          'lower': stack['lower'][rows].ravel(),
+                          'upper': stack['upper'][rows].ravel()})
+    totals = pd.DataFrame({'year': years, 'total': stack['totals'][rows]})
+    return bands, totals
+
+
+def _index_countries(stack):
+    # country -> slice of its (contiguous, sorted) rows in the stack
+    country = stack['country']
+    starts = np.flatnonzero(np.r_[True, country[1:] != country[:-1]])
+    ends = np.r_[starts[1:], len(country)]
+    return {country[start]: slice(start, end) for start, end in zip(starts, ends)}
+
+
+# 'stack' -> (stack_arrays of the whole deaths table, its country index)
+_cube = {}
+# (source, country) -> (compute, (bands, totals))
+_stacks = {}
+
+
+def _whole_table():
+    cube = _cube.get('stack')
+    if cube is None:
+        stack = stack_arrays(loaders.load_deaths())
+        cube = _cube.setdefault('stack', (stack, _index_countries(stack)))
+    return cube
+
+
+def stacked_shares():
+    """``stack_arrays`` of the whole deaths-by-age table."""
+    return _whole_table()[0]
+
+
+def cached_stack(source, country, compute):
+    """``compute()`` of one country, cached per ``(source, country)``."""
+    entry = _stacks.get((source, country))
+    if entry is None:
+        entry = _stacks.setdefault((source, country), (compute, compute()))
+    return entry[1]
+
+
+def country_stack(country):
+    """``(bands, totals)`` frames of one country of the in-memory table, cached per country."""
+    def compute():
+        stack, rows = _whole_table()
+        return stack_frames(stack, rows.get(country, slice(0, 0)))
+    return cached_stack('pandas', country, compute)
+
+
+def update_countries(deaths, countries):
+    """Re-stack ``countries`` from the updated wide table ``deaths``.
+
+    Only the rows of these countries are recomputed and spliced into the
+    whole-table stack, and only their cached frames are rebuilt. Each new
+    value replaces the old one in place, so readers never hit an empty cache.
+    """
+    countries = list(countries)
+    if 'stack' in _cube:
+        stack = _cube['stack'][0]
+        partial = stack_arrays(deaths[deaths['country'].isin(countries)])
+        keep = ~pd.Series(stack['country']).isin(countries).to_numpy()
+        merged = {key: np.concatenate([stack[key][keep], partial[key]]) for key in stack}
+        order = pd.DataFrame({'country': merged['country'], 'year': merged['year']}).sort_values(
+            ['country', 'year'], kind='mergesort').index.to_numpy()
+        merged = {key: values[order] for key, values in merged.items()}
+        _cube['stack'] = (merged, _index_countries(merged))
+    for key, (compute, _) in list(_stacks.items()):
+        if key[1] in countries:
+            _stacks[key] = (compute, compute())
+
+
+def clear_caches():
+    _cube.clear()
+    _stacks.clear()
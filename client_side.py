@@ -0,0 +1,242 @@
+"""Client-side interaction mode for the deaths and sales sections.
+
+Instead of Streamlit widgets (every change is a full Python rerun), the
+controls are Vega-Lite selections bound to input elements and the data is
+shipped once in a compact per-country layout (measures as columns, folded
+back to long form in the browser). Switching country or year range then
+costs no server CPU.
+
+The payload keeps everything the server-side view draws, so both modes show
+the same charts: one row per country and year of the age shares and their
+stack offsets precomputed by age_stacks (the browser stacks nothing), and of
+the risk factors in whole deaths (the bars sum the brushed years). That is
+about 1.5 MB of CSV, over the default budget, so the deaths section only
+runs client-side when ``TOBACCO_CLIENT_SIDE_MAX_BYTES`` is raised.
+
+The mode is only worth it when that payload is small: ``cached`` measures
+it as the CSV actually shipped and only builds the section's spec when it
+fits. Payloads, sizes and specs are computed once per data version (updated
+by refresh.py), not on every rerun.
+"""
+import os
+
+import startup
+import compact
+import datasets
+import age_stacks
+import sales_trends
+
+alt = startup.lazy_import('altair')
+np = startup.lazy_import('numpy')
+pd = startup.lazy_import('pandas')
+
+
+# Largest inline payload (bytes of CSV) shipped for a client-side section
+CLIENT_SIDE_MAX_BYTES = int(os.environ.get('TOBACCO_CLIENT_SIDE_MAX_BYTES', 1000000))
+
+# Decimals of the shipped age shares and offsets, 0.1% as in the tooltip
+BAND_DECIMALS = 3
+
+
+def payload_bytes(*frames):
+    """Size of the frames as CSV, as ``compact.chart_spec`` inlines them."""
+    return sum(compact.csv_bytes(frame) for frame in frames)
+
+
+def use_client_side(size, max_bytes=None):
+    """Whether a payload of ``size`` bytes (see ``cached``) is small enough for client-side mode."""
+    if max_bytes is None:
+        max_bytes = CLIENT_SIDE_MAX_BYTES
+    return size <= max_bytes
+
+
+####### Payloads
+
+def deaths_bands(deaths):
+    """``age_stacks`` bands of a wide deaths-by-age frame, one row per country and year.
+
+    Columns: ``total`` deaths of all ages, and for each age group its share
+    (named after the group) and its ``lower <group>`` and ``upper <group>``
+    stack offsets.
+    """
+    stack = age_stacks.stack_arrays(deaths.loc[:, datasets.DEATHS.view('client')])
+    columns = {'country': stack['country'], 'year': stack['year'],
+               'total': np.round(stack['totals']).astype('int64')}
+    for i, age in enumerate(datasets.AGE_GROUPS):
+        columns[age] = np.round(stack['shares'][:, i], BAND_DECIMALS)
+        columns['lower ' + age] = np.round(stack['lower'][:, i], BAND_DECIMALS)
+        columns['upper ' + age] = np.round(stack['upper'][:, i], BAND_DECIMALS)
+    return pd.DataFrame(columns)
+
+
+def deaths_payload(deaths, factors):
+    """Age bands (``deaths_bands``) and deaths by risk factor, in whole deaths, per country and year."""
+    factors_wide = factors.loc[:, datasets.FACTORS.view('client')]
+    # Whole deaths, written without a trailing '.0' (missing values stay empty)
+    factors_wide = factors_wide.assign(**{factor: factors_wide[factor].round().astype('Int64')
+                                          for factor in datasets.RISK_FACTORS})
+    return deaths_bands(deaths), factors_wide
+
+
+def sales_payload(sales_data):
+    """Sales series and their precomputed trends (see sales_trends), without the columns the chart never reads."""
+    columns = datasets.SALES.view('chart') + sales_trends.TREND_COLUMNS
+    return sales_data.loc[:, columns].dropna(subset=datasets.SALES.view('chart'))
+
+
+####### Cache
+
+# name -> (compute, chart, (payload frames, their size in bytes, shipped spec))
+_payloads = {}
+
+
+def cached(name, compute, chart=None):
+    """``(frames, size, spec)`` of a client-side section, cached per ``name``.
+
+    ``frames`` is ``compute()`` and ``size`` its ``payload_bytes``; ``spec`` is
+    the ``compact.chart_spec`` of ``chart(*frames)``, built only when the
+    payload is small enough for client-side mode and None otherwise.
+    """
+    entry = _payloads.get(name)
+    if entry is None:
+        entry = _payloads.setdefault(name, (compute, chart, _build(compute, chart)))
+    return entry[2]
+
+
+def _build(compute, chart):
+    frames = compute()
+    size = payload_bytes(*frames)
+    spec = compact.chart_spec(chart(*frames)) if chart is not None and use_client_side(size) else None
+    return frames, size, spec
+
+
+def update():
+    """Rebuild every cached payload from the current tables (refresh.py), replacing it in place."""
+    for name, (compute, chart, _) in list(_payloads.items()):
+        _payloads[name] = (compute, chart, _build(compute, chart))
+
+
+def clear_caches():
+    _payloads.clear()
+
+
+####### Charts
+
+def deaths_charts(bands, factors_wide, age_groups, risk_factors):
+    """Area, line and bar charts of the deaths section driven by a bound dropdown."""
+    countries = sorted(bands['country'].unique())
+    select_country = alt.selection_single(
+        name='Select',  # name the selection 'Select'
+        fields=['country'],  # limit selection to the country field
+        init={'country': countries[0]},  # use first country entry as initial value
+        bind=alt.binding_select(options=countries, name='Select a country: ')
+    )
+    brush = alt.selection_interval(encodings=['x'])
+
+    # Year selection
+    years = alt.Chart(bands).mark_line().add_selection(
+        brush, select_country
+    ).transform_filter(
+        select_country
+    ).encode(
+        alt.X('year:O', title='Year'),
+        alt.Y('total:Q', title='Smoking Deaths (all ages)')
+    ).properties(
+        width=400,
+        height=100
+    )
+
+    # Area chart - Smoking deaths by ages, drawn from the precomputed bands: the
+    # fold only picks each group's own offsets, nothing is stacked in the browser
+    base = alt.Chart(bands).mark_area().transform_filter(
+        select_country
+    ).transform_filter(
+        brush
+    ).transform_fold(
+        list(age_groups), as_=['Age', 'share']
+    ).transform_calculate(
+        lower="datum['lower ' + datum.Age]",
+        upper="datum['upper ' + datum.Age]"
+    ).encode(
+        alt.X('year:O', title='Year'),
+        y=alt.Y('lower:Q', title='Smoking Deaths by Ages (normalized)',
+                scale=alt.Scale(domain=[0, 1]), axis=alt.Axis(format='%')),
+        y2='upper:Q',
+        color=alt.Color('Age:O', scale=alt.Scale(scheme='lightorange')),
+        tooltip=['Age:O', alt.Tooltip('share:Q', format='.1%')],
+        text='Age:O'
+    ).properties(
+        width=400,
+        height=200
+    )
+
+    # Bar chart - Risk factors
+    bar_factors = alt.Chart(factors_wide).mark_bar().transform_filter(
+        select_country
+    ).transform_filter(
+        brush
+    ).transform_fold(
+        list(risk_factors), as_=['Risk Factor', 'value']
+    ).encode(
+        alt.X('sum(value):Q', title='Total deaths'),
+        y=alt.Y('Risk Factor:O',sort='-x'),
+        tooltip='sum(value):Q',
+        color=alt.condition(
+          alt.datum['Risk Factor'] == 'Smoking',
+          alt.value("red"),  # Smoking color
+          alt.value("lightgray")  # Other than smoking
+        )
+    ).properties(
+        width=200,
+        height=400
+    )
+    return base, years, bar_factors
+
+
+def sales_chart(sales, default_countries, default_period, default_mode='Raw'):
+    """Sales trend with a legend-bound country selection, two year sliders and a raw / smoothed switch."""
+    minyear, maxyear = int(sales['Year'].min()), int(sales['Year'].max())
+    select_countries = alt.selection_multi(
+        fields=['Country'],
+        bind='legend',  # click (shift-click to add) countries in the legend
+        init=[{'Country': country} for country in default_countries]
+    )
+    period_from = alt.selection_single(
+        name='SalesFrom', fields=['year'], init={'year': default_period[0]},
+        bind=alt.binding_range(min=minyear, max=maxyear, step=1, name='From ')
+    )
+    period_to = alt.selection_single(
+        name='SalesTo', fields=['year'], init={'year': default_period[1]},
+        bind=alt.binding_range(min=minyear, max=maxyear, step=1, name='To ')
+    )
+    mode = alt.selection_single(
+        name='SalesMode', fields=['mode'], init={'mode': default_mode},
+        bind=alt.binding_radio(options=list(sales_trends.MODES), name='Show ')
+    )
+
+    # Both series are in the payload, the switch only picks the column drawn
+    base = alt.Chart(sales).transform_filter(
+        (alt.datum.Year >= period_from.year) & (alt.datum.Year <= period_to.year)
+    ).transform_calculate(
+        value="SalesMode.mode == 'Smoothed' ? datum.%s : datum.%s" % (
+            sales_trends.MODES['Smoothed'], sales_trends.MODES['Raw'])
+    ).encode(
+    alt.X('Year', axis=alt.Axis(title='Years', tickCount=5)),
+    alt.Y('value:Q', axis=alt.Axis(title='Avg daily sales of cigarretes')),
+    alt.Color('Country')
+    )
+    lines = base.mark_line().encode(
+        opacity=alt.condition(select_countries, alt.value(1), alt.value(0))
+    ).add_selection(
+        select_countries, period_from, period_to, mode
+    )
+    # Year of highest sales of each selected country
+    peaks = base.mark_point(shape='triangle-up', filled=True, size=80).transform_filter(
+        select_countries
+    ).transform_filter(
+        alt.datum.peak
+    ).encode(
+        tooltip=['Country', 'Year', 'NumCig', alt.Tooltip('yoy:Q', title='change from previous year')]
+    )
+    return alt.layer(lines, peaks, height=500, width=700,
+                     title='Average number of cigarettes sold daily during chosen period of time')
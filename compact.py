@@ -0,0 +1,229 @@
+"""Compact serialization of the data inlined into chart specs.
+
+Altair inlines chart data as JSON records: every row repeats every field name
+and numbers keep full float64 text precision (``7678.717644361205``,
+``11.60000038146973``). ``compact_spec`` rewrites the top-level ``datasets``
+of a spec instead:
+
+* float columns are rounded to ``COMPACT_DIGITS`` significant digits (or a
+  per-column number of digits) and written in their shortest form;
+* each dataset becomes a CSV string, so a field name is written once in the
+  header rather than once per row (which makes renaming fields pointless), and
+  the views reading it get a matching ``format`` with explicit number parsing.
+
+Streamlit 0.72 turns a spec's ``datasets`` back into DataFrame messages, so
+the dashboard ships ``chart_spec``: the compact datasets inlined as
+``data.values`` of the views reading them (see ``inline_spec``), drawn with
+``st.vega_lite_chart``.
+
+Usage:
+    python compact.py spec.json [--digits 6] [--output compact.json]
+"""
+import os
+import io
+import sys
+import json
+import argparse
+from collections import Counter
+
+import startup
+
+alt = startup.lazy_import('altair')
+np = startup.lazy_import('numpy')
+pd = startup.lazy_import('pandas')
+
+
+COMPACT_DIGITS = int(os.environ.get('TOBACCO_COMPACT_DIGITS', 6))
+
+# Properties of the top-level spec only, left outside the view wrapped by inline_spec
+TOP_LEVEL_KEYS = {'$schema', 'config', 'background', 'padding', 'autosize', 'usermeta', 'datasets'}
+
+
+def round_significant(values, digits=COMPACT_DIGITS):
+    """Round a float array to ``digits`` significant digits (NaN and 0 kept as is)."""
+    values = np.asarray(values, dtype='float64')
+    magnitude = np.floor(np.log10(np.abs(np.where(values == 0, 1, values))))
+    scale = 10.0 ** (digits - 1 - np.nan_to_num(magnitude))
+    return np.round(values * scale) / scale
+
+
+def round_frame(frame, digits=COMPACT_DIGITS):
+    """Copy of ``frame`` with its float columns rounded to significant digits.
+
+    ``digits`` is either one number for every column or a dict of per-column
+    digits (columns missing from it get ``COMPACT_DIGITS``).
+    """
+    frame = frame.copy()
+    for column in frame.columns:
+        if frame[column].dtype.kind == 'f':
+            column_digits = digits.get(column, COMPACT_DIGITS) if isinstance(digits, dict) else digits
+            frame[column] = round_significant(frame[column].to_numpy(), column_digits)
+    return frame
+
+
+def _csv_format(frame):
+    parse = {}
+    for column in frame.columns:
+        kind = frame[column].dtype.kind
+        if kind in 'iuf':
+            parse[column] = 'number'
+        elif kind == 'b':
+            parse[column] = 'boolean'
+    return {'type': 'csv', 'parse': parse}
+
+
+def _to_csv(frame, digits):
+    # Rounded floats are written with their shortest repr, 11.6 not 11.60000038146973
+    frame = round_frame(frame, digits)
+    # Vega parses only 'false' and '0' as false, not pandas' False
+    for column in frame.columns:
+        if frame[column].dtype.kind == 'b':
+            frame[column] = np.where(frame[column].to_numpy(), 'true', 'false')
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+
+def csv_bytes(frame, digits=COMPACT_DIGITS):
+    """Size of ``frame`` as the CSV text ``inline_spec`` ships."""
+    return len(_to_csv(frame, digits))
+
+
+def _set_formats(spec, formats):
+    # Named data references anywhere in the spec (layers, concats, lookups)
+    if isinstance(spec, dict):
+        if isinstance(spec.get('name'), str) and spec['name'] in formats and \
+                set(spec) <= {'name', 'format'}:
+            spec['format'] = formats[spec['name']]
+        for value in spec.values():
+            _set_formats(value, formats)
+    elif isinstance(spec, list):
+        for value in spec:
+            _set_formats(value, formats)
+
+
+def compact_spec(spec, digits=COMPACT_DIGITS):
+    """Copy of a Vega-Lite spec dict with its ``datasets`` rounded and CSV-encoded."""
+    return _compact(spec, digits)[0]
+
+
+def _compact(spec, digits):
+    # The compacted spec and the csv format of each dataset
+    spec = json.loads(json.dumps(spec))
+    datasets = spec.get('datasets', {})
+    formats = {}
+    for name, records in datasets.items():
+        if not isinstance(records, list) or not records or not isinstance(records[0], dict):
+            continue
+        frame = pd.DataFrame.from_records(records)
+        datasets[name] = _to_csv(frame, digits)
+        formats[name] = _csv_format(frame)
+    _set_formats({key: value for key, value in spec.items() if key != 'datasets'}, formats)
+    return spec, formats
+
+
+def _data_name(data, datasets):
+    if isinstance(data, dict) and isinstance(data.get('name'), str) and data['name'] in datasets:
+        return data['name']
+    return None
+
+
+def _count_references(spec, datasets, references):
+    if isinstance(spec, dict):
+        name = _data_name(spec.get('data'), datasets)
+        if name is not None:
+            references[name] += 1
+        for value in spec.values():
+            _count_references(value, datasets, references)
+    elif isinstance(spec, list):
+        for value in spec:
+            _count_references(value, datasets, references)
+
+
+def _inline(spec, datasets, inherited=None):
+    # Each named reference becomes the dataset's values, except in views inheriting it already
+    if isinstance(spec, dict):
+        data = spec.get('data')
+        name = _data_name(data, datasets)
+        if name is not None:
+            # A lookup's data (with its 'key') is never inherited
+            if name == inherited and 'key' not in spec:
+                del spec['data']
+            else:
+                spec['data'] = dict({'values': datasets[name]}, **{
+                    key: value for key, value in data.items() if key != 'name'})
+        if 'key' not in spec and data is not None:
+            inherited = name
+        for value in spec.values():
+            _inline(value, datasets, inherited)
+    elif isinstance(spec, list):
+        for value in spec:
+            _inline(value, datasets, inherited)
+
+
+def inline_spec(spec, digits=COMPACT_DIGITS):
+    """``compact_spec`` of ``spec`` with its datasets written into the views reading them.
+
+    Streamlit only converts the top-level ``datasets`` and ``data.values``, so
+    a spec reading a dataset at its top level is wrapped in a one-view
+    ``vconcat``. When the top level reads no data, the dataset read by the
+    most views moves up to the wrapped view instead of being repeated in each.
+    """
+    spec, formats = _compact(spec, digits)
+    datasets = spec.pop('datasets', {})
+    if not datasets:
+        return spec
+    view = {key: value for key, value in spec.items() if key not in TOP_LEVEL_KEYS}
+    if 'data' not in view:
+        references = Counter()
+        _count_references(view, datasets, references)
+        shared = [name for name, count in references.items() if count > 1]
+        if shared:
+            name = max(shared, key=lambda name: (references[name] - 1) * len(datasets[name]))
+            view['data'] = {'name': name}
+            _set_formats(view['data'], formats)
+    _inline(view, datasets)
+    if 'data' not in view:
+        return dict(view, **{key: value for key, value in spec.items() if key in TOP_LEVEL_KEYS})
+    return dict({key: value for key, value in spec.items() if key in TOP_LEVEL_KEYS}, vconcat=[view])
+
+
+def chart_spec(chart, digits=COMPACT_DIGITS):
+    """Spec of an Altair chart (or of a spec dict) as the dashboard ships it, see ``inline_spec``."""
+    if not isinstance(chart, dict):
+        with alt.data_transformers.enable('default', max_rows=None):
+            chart = chart.to_dict()
+    return inline_spec(chart, digits)
+
+
+def spec_bytes(spec):
+    return len(json.dumps(spec, separators=(',', ':')))
+
+
+def savings(spec, digits=COMPACT_DIGITS):
+    """Bytes of ``spec`` before and after ``inline_spec``, as the dashboard ships it."""
+    before = spec_bytes(spec)
+    after = spec_bytes(inline_spec(spec, digits))
+    return {'spec_bytes': before, 'compact_bytes': after, 'saved_bytes': before - after}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compact the inlined data of a Vega-Lite spec.')
+    parser.add_argument('spec')
+    parser.add_argument('--digits', type=int, default=COMPACT_DIGITS)
+    parser.add_argument('--output')
+    args = parser.parse_args(argv)
+
+    with open(args.spec) as f:
+        spec = json.load(f)
+    compacted = compact_spec(spec, args.digits)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(compacted, f, separators=(',', ':'))
+    before, after = spec_bytes(spec), spec_bytes(compacted)
+    print('%d -> %d bytes (%.1f%% saved)' % (before, after, 100.0 * (before - after) / max(before, 1)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The dashboard modules are top-level modules of the repository: make them importable
+# whatever directory pytest runs from
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,274 @@
+"""Control-policy views: map and scatter builders and their precompiled specs.
+
+The control-policy section has a small, closed input space (7 control
+metrics x 6 survey years for the map, 7 metrics for the scatter), so every
+spec can be built up front. ``precompile`` builds them in a process pool and
+stores them in ``SPEC_CACHE``; ``map_spec``/``scatter_spec`` are then plain
+lookups, falling back to an on-demand build (also cached) for anything not
+precompiled, such as the WHO-region maps.
+
+The dashboard only precompiles at startup with TOBACCO_PRECOMPILE_ON_START=1:
+each worker process imports altair, which every server process would
+otherwise pay for on its first rerun.
+
+Usage:
+    python control_views.py --workers 1 2 4 8 [--regions]
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import startup
+import loaders
+import regions
+
+alt = startup.lazy_import('altair')
+
+
+control_dataset = 'https://raw.githubusercontent.com/JulioCandela1993/VisualAnalytics/master/data/control_policy.csv'
+deaths_dataset = 'https://raw.githubusercontent.com/JulioCandela1993/VisualAnalytics/master/data/deaths.csv'
+url_topojson = 'https://raw.githubusercontent.com/JulioCandela1993/VisualAnalytics/master/world-countries.json'
+
+YEARS = [2008, 2010, 2012, 2014, 2016, 2018]
+REGIONS = ['World'] + list(regions.WHO_REGIONS)
+
+PRECOMPILE_ON_START = os.environ.get('TOBACCO_PRECOMPILE_ON_START', '0') == '1'
+PRECOMPILE_WORKERS = int(os.environ.get('TOBACCO_PRECOMPILE_WORKERS', min(os.cpu_count() or 1, 4)))
+
+
+####### Builders
+
+def map_chart(metric_name, select_year, select_region='World'):
+    metric_to_show_in_covid_Layer = metric_name + ":Q"
+    columns = ["d" + str(year) for year in YEARS]
+
+    if select_region == 'World':
+        data_topojson = alt.topo_feature(url=url_topojson, feature='countries1')
+    else:
+        # Only the features of the selected region are shipped and projected. Named inline
+        # data stays in the layers: Streamlit replaces the spec's top-level datasets
+        data_topojson = alt.InlineData(values=regions.region_topology(select_region),
+                                       format=alt.DataFormat(type='topojson', feature='countries1'),
+                                       name='region-' + select_region)
+
+    map_geojson = alt.Chart(data_topojson).mark_geoshape(
+        stroke="black",
+        strokeWidth=1,
+        fill='lightgray'
+    ).encode(
+        color=metric_to_show_in_covid_Layer,
+    ).transform_lookup(
+            lookup="properties.name",
+            from_=alt.LookupData(control_dataset, "Country", [metric_name,"Year"])
+    ).properties(
+        width=800,
+        height=400
+    )
+
+    choro = alt.Chart(data_topojson).mark_geoshape(
+        stroke='black'
+    ).encode(
+        color=metric_to_show_in_covid_Layer,
+                tooltip=[
+                    alt.Tooltip("properties.name:O", title="Country name"),
+                    alt.Tooltip(metric_to_show_in_covid_Layer, title=metric_name),
+                    alt.Tooltip("year:Q", title="Year"),
+                ],
+    ).transform_calculate(
+        d2008 = "1",
+        d2010 = "1",
+        d2012 = "1",
+        d2014 = "1",
+        d2016 = "1",
+        d2018 = "1"
+    ).transform_fold(
+        columns, as_=['year', 'metric']
+    ).transform_calculate(
+        yearQ = 'replace(datum.year,"d","")'
+    ).transform_calculate(
+        key_val = 'datum.properties.name + datum.yearQ'
+    ).transform_lookup(
+            lookup="key_val",
+            from_=alt.LookupData(control_dataset, "ID", [metric_name,"Year"])
+    ).transform_calculate(
+        year='parseInt(datum.Year)',
+    ).transform_filter(
+        alt.FieldEqualPredicate(field='year', equal=select_year)
+    )
+
+    map_layers = map_geojson + choro
+    if select_region != 'World':
+        # Low-detail outline of the world behind the region, projection fitted to the region
+        world_outline = alt.Chart(alt.InlineData(values=regions.world_outline(),
+                                                 format=alt.DataFormat(type='topojson', feature='countries1'),
+                                                 name='world-outline')
+        ).mark_geoshape(
+            fill='#EEEEEE',
+            stroke='white',
+            strokeWidth=0.5,
+            clip=True
+        )
+        map_layers = (world_outline + map_layers).project(**regions.region_projection(select_region, 800, 400))
+    return map_layers
+
+
+def scatter_chart(metric_name):
+    brush = alt.selection_interval()
+
+    base_scatter = alt.Chart(control_dataset).transform_lookup(
+            lookup="ID",
+            from_=alt.LookupData(deaths_dataset, "ID", ["deaths","Year"])
+    ).transform_calculate(
+        deaths='parseFloat(datum.deaths)',
+        year='parseInt(datum.Year)',
+        metric = alt.datum[metric_name]
+    ).transform_calculate(
+        deaths_2016='datum.year==2016?datum.deaths:0',
+        deaths_2008='datum.year==2008?datum.deaths:0',
+        metric_2016='datum.year==2016?datum.metric:0',
+        metric_2008='datum.year==2008?datum.metric:0',
+        year='parseInt(datum.Year)',
+    ).transform_aggregate(
+        deaths_2016='sum(deaths_2016)',
+        metric_2016='sum(metric_2016)',
+        deaths_2008='sum(deaths_2008)',
+        metric_2008='sum(metric_2008)',
+        groupby=["Country"]
+    ).transform_calculate(
+        incr_ratio_deaths='((datum.deaths_2016/datum.deaths_2008)-1)*100',
+        incr_ratio_metric='((datum.metric_2016/datum.metric_2008)-1)*100',
+    )
+
+    xscale = alt.Scale(domain=(-100, 400))
+    yscale = alt.Scale(domain=(-100, 200))
+
+    points_scatter = base_scatter.mark_circle().encode(
+        alt.X('incr_ratio_metric:Q', scale = xscale, title = '% change of efforts in ' + metric_name + ' from 2008 to 2016'),
+        alt.Y('incr_ratio_deaths:Q', scale=yscale, title = '% change in deaths from 2008 to 2016'),
+        tooltip=[
+                    alt.Tooltip("Country:N", title="Country"),
+                ],
+    ).properties(
+        width=600,
+        height=400
+    ).transform_filter(brush)
+
+    regression_scatter = points_scatter.transform_regression(
+            on='incr_ratio_metric', regression='incr_ratio_deaths'#, method = 'log'
+    ).mark_line(color='orange')
+
+    scatter_final = (points_scatter + regression_scatter)
+
+    top_hist = base_scatter.mark_area().encode(
+        alt.X("incr_ratio_metric:Q",
+              bin=alt.Bin(maxbins=10, extent=xscale.domain),
+              title=''
+              ),
+        alt.Y('count()', title='N° Countries'),
+    ).add_selection(
+        brush
+    ).properties(width=600 , height=80)
+
+    right_hist = base_scatter.mark_area().encode(
+        alt.Y('incr_ratio_deaths:Q',
+              bin=alt.Bin(maxbins=20, extent=yscale.domain),
+              title='',
+              ),
+        alt.X('count()', title='N° Countries'),
+    ).add_selection(
+        brush
+    ).properties(width=100, height=400)
+
+    return top_hist & (scatter_final |right_hist )
+
+
+####### Spec cache
+
+# ('map', metric, year, region) or ('scatter', metric) -> Vega-Lite spec dict
+SPEC_CACHE = {}
+_cache_lock = threading.Lock()
+
+
+def build_spec(key):
+    """Vega-Lite spec dict for a cache key (runs in the pool workers too)."""
+    if key[0] == 'map':
+        return key, map_chart(*key[1:]).to_dict()
+    return key, scatter_chart(*key[1:]).to_dict()
+
+
+def _lookup(key):
+    spec = SPEC_CACHE.get(key)
+    if spec is None:
+        spec = build_spec(key)[1]
+        with _cache_lock:
+            SPEC_CACHE[key] = spec
+    return spec
+
+
+def map_spec(metric_name, select_year, select_region='World'):
+    return _lookup(('map', metric_name, select_year, select_region))
+
+
+def scatter_spec(metric_name):
+    return _lookup(('scatter', metric_name))
+
+
+def all_keys(with_regions=False):
+    map_regions = REGIONS if with_regions else ['World']
+    keys = [('map', metric, year, region)
+            for region in map_regions for metric in loaders.CONTROL_METRICS for year in YEARS]
+    return keys + [('scatter', metric) for metric in loaders.CONTROL_METRICS]
+
+
+def precompile(workers=PRECOMPILE_WORKERS, with_regions=False):
+    """Build every spec of the section into SPEC_CACHE; returns the build time in seconds."""
+    keys = [key for key in all_keys(with_regions) if key not in SPEC_CACHE]
+    start = time.perf_counter()
+    if workers <= 1:
+        built = [build_spec(key) for key in keys]
+    else:
+        # spawn, not fork: the dashboard process runs server threads
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            built = list(pool.map(build_spec, keys, chunksize=max(1, len(keys) // (4 * workers))))
+    with _cache_lock:
+        SPEC_CACHE.update(built)
+    return time.perf_counter() - start
+
+
+_precompile_thread = None
+
+
+def precompile_in_background(workers=PRECOMPILE_WORKERS, with_regions=False):
+    """Start ``precompile`` once per process without blocking the caller."""
+    global _precompile_thread
+    with _cache_lock:
+        if _precompile_thread is None:
+            _precompile_thread = threading.Thread(target=precompile, args=(workers, with_regions),
+                                                  daemon=True)
+            _precompile_thread.start()
+    return _precompile_thread
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Precompile the control-policy specs and time it.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, PRECOMPILE_WORKERS])
+    parser.add_argument('--regions', action='store_true', help='also precompile the WHO-region maps')
+    args = parser.parse_args(argv)
+
+    print('%d specs' % len(all_keys(args.regions)))
+    baseline = None
+    for workers in args.workers:
+        SPEC_CACHE.clear()
+        elapsed = precompile(workers, args.regions)
+        baseline = baseline or elapsed
+        print('%2d workers: %6.2f s  speedup x%.2f' % (workers, elapsed, baseline / elapsed))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""Registry of the datasets in data/: files, columns, dtypes and views.
+
+Each ``Dataset`` declares its file, its columns in file order (the names
+they get, replacing the long OWID headers) with explicit dtypes, its
+(country, year) key and the columns each of its views reads. The 'frame'
+view is what the in-memory consumers (repository, query API, derived caches)
+read from a loaded frame; 'store' is the SQLite store's, read by sql_store.py
+and refresh.py only. ``read`` parses the columns of the in-memory views by
+default, with their declared dtypes, so no column is parsed for nothing and
+pandas never has to infer a type.
+
+loaders.py, main.py, smoking_deaths.py, tobacco_sales.py, the SQLite store
+and refresh.py all take their definitions from here.
+"""
+import os
+
+import startup
+
+pd = startup.lazy_import('pandas')
+
+
+DATA_DIR = os.environ.get('TOBACCO_DATA_DIR', 'data')
+
+AGE_GROUPS = ['15 to 49', '50 to 69', 'Above 70']
+
+RISK_FACTORS = ['Diet low in vegetables',
+                'Diet low in nuts and seeds',
+                'Diet low in calcium',
+                'Unsafe sex',
+                'No access to handwashing facility',
+                'Child wasting',
+                'Child stunting',
+                'Diet high in red meat',
+                'Diet low in fiber',
+                'Diet low in seafood omega-3 fatty acids',
+                'Diet high in sodium',
+                'Low physical activity',
+                'Non-exclusive breastfeeding',
+                'Discontinued breastfeeding',
+                'Iron deficiency',
+                'Vitamin A deficiency',
+                'Zinc deficiency',
+                'Smoking',
+                'Secondhand smoke',
+                'Alcohol use',
+                'Drug use',
+                'High fasting plasma glucose',
+                'High total cholesterol', # Many null values
+                'High systolic blood pressure',
+                'High body-mass index',
+                'Low bone mineral density',
+                'Diet low in fruits',
+                'Diet low in legumes',
+                'Low birth weight for gestation',
+                'Unsafe water source',
+                'Unsafe sanitation',
+                'Household air pollution from solid fuels',
+                'Air pollution',
+                'Outdoor air pollution']
+
+# Control measures given by WHO
+CONTROL_METRICS = ["Monitor",
+                   "Protect from tobacco smoke",
+                   "Offer help to quit tobacco use",
+                   "Warn about the dangers of tobacco",
+                   "Enforce bans on tobacco advertising",
+                   "Raise taxes on tobacco",
+                   "Anti-tobacco mass media campaigns"]
+
+
+class Dataset:
+    """One CSV file of data/ and how it is parsed and used."""
+
+    def __init__(self, name, filename, columns, country, year, indexed=(), views=None, na_values=None):
+        self.name = name  # also the table name in the SQLite store
+        self.filename = filename
+        self.columns = columns  # [(name, dtype)] in file order
+        self.na_values = na_values  # extra missing-value markers of the file
+        self.country = country
+        self.year = year
+        self.indexed = list(indexed)  # indexed in the store besides the key
+        self.views = views or {}
+
+    @property
+    def path(self):
+        return os.path.join(DATA_DIR, self.filename)
+
+    @property
+    def names(self):
+        return [name for name, _ in self.columns]
+
+    @property
+    def dtypes(self):
+        return dict(self.columns)
+
+    @property
+    def keys(self):
+        return [self.country, self.year]
+
+    def view(self, name):
+        """Columns read by view ``name``, in file order."""
+        return [column for column in self.names if column in self.views[name]]
+
+    @property
+    def used_columns(self):
+        """Columns of the in-memory frames: read by at least one view besides 'store', in file order."""
+        used = set(self.keys).union(*(columns for name, columns in self.views.items() if name != 'store'))
+        return [column for column in self.names if column in used]
+
+    def __repr__(self):
+        return '<Dataset %s>' % self.name
+
+
+def read(dataset, columns=None, path=None, **kwargs):
+    """Parse ``columns`` of ``dataset`` (default: the in-memory columns) with their declared dtypes."""
+    columns = columns or dataset.used_columns
+    dtypes = dataset.dtypes
+    return pd.read_csv(path or dataset.path,
+                       header=0,
+                       index_col=False,
+                       names=dataset.names,
+                       usecols=columns,
+                       dtype={column: dtypes[column] for column in columns},
+                       na_values=dataset.na_values,
+                       **kwargs)
+
+
+####### Registry
+
+DEATHS = Dataset(
+    'deaths_by_age', 'smoking-deaths-by-age.csv',
+    [('country', str), ('code', str), ('year', 'int64')] + [(age, 'float64') for age in AGE_GROUPS],
+    country='country', year='year', indexed=['code'],
+    views={'frame': ['country', 'year'] + AGE_GROUPS,
+           'client': ['country', 'year'] + AGE_GROUPS,
+           'store': ['country', 'code', 'year'] + AGE_GROUPS})
+
+FACTORS = Dataset(
+    'risk_factors', 'number-of-deaths-by-risk-factor.csv',
+    # 'Diet low in whole grains' is in the file but no view reads it
+    [('country', str), ('code', str), ('year', 'int64'),
+     ('Diet low in vegetables', 'float64'), ('Diet low in whole grains', 'float64')] +
+    [(factor, 'float64') for factor in RISK_FACTORS[1:]],
+    country='country', year='year', indexed=['code'],
+    views={'frame': ['country', 'year'] + RISK_FACTORS,
+           'client': ['country', 'year'] + RISK_FACTORS,
+           'store': ['country', 'code', 'year'] + RISK_FACTORS})
+
+SALES = Dataset(
+    'sales', 'sales-of-cigarettes-per-adult-per-day.csv',
+    [('Country', str), ('Code', str), ('Year', 'int64'), ('NumCig', 'float64')],
+    country='Country', year='Year', indexed=['Code'],
+    views={'frame': ['Country', 'Year', 'NumCig'],
+           'chart': ['Country', 'Year', 'NumCig'],
+           'store': ['Country', 'Code', 'Year', 'NumCig']})
+
+CONTROL_POLICY = Dataset(
+    'control_policy', 'control_policy.csv',
+    # Scores from 1 to 5, some missing
+    [('ID', str), ('Country', str), ('Year', 'int64')] + [(metric, 'float64') for metric in CONTROL_METRICS],
+    country='Country', year='Year', indexed=['ID'], na_values=['Data not available', 'Not applicable'],
+    views={'frame': ['ID', 'Country', 'Year'] + CONTROL_METRICS,
+           'store': ['ID', 'Country', 'Year'] + CONTROL_METRICS})
+
+CONTROL_DEATHS = Dataset(
+    'control_deaths', 'deaths.csv',
+    [('ID', str), ('Country', str), ('Code', str), ('Year', 'int64'), ('deaths', 'float64')],
+    country='Country', year='Year', indexed=['Code', 'ID'],
+    views={'frame': ['ID', 'Code', 'deaths'],
+           'store': ['ID', 'Country', 'Code', 'Year', 'deaths']})
+
+DATASETS = {dataset.name: dataset for dataset in
+            [DEATHS, FACTORS, SALES, CONTROL_POLICY, CONTROL_DEATHS]}
@@ -0,0 +1,102 @@
+"""Charts of the deaths section for one country (server mode).
+
+Shared by main.py, which builds them for the country picked in the
+dropdown, and export.py, which builds them for every country.
+"""
+import startup
+import loaders
+
+alt = startup.lazy_import('altair')
+pd = startup.lazy_import('pandas')
+
+
+def factors_long(factors):
+    """Wide risk-factor rows to one row per country, year and risk factor."""
+    return pd.melt(factors, id_vars=['country', 'year'],
+                   value_vars=loaders.RISK_FACTORS, var_name='Risk Factor')
+
+
+def factor_totals(factors):
+    """Long risk-factor rows totaled over every year, the largest first."""
+    totals = factors.groupby(['country', 'Risk Factor'], sort=False)['value'].sum().reset_index()
+    return totals.sort_values('value', ascending=False, kind='mergesort').reset_index(drop=True)
+
+
+def country_charts(deaths_bands, deaths_totals, factors_view, selectCountry):
+    """Area, line and bar charts of one country, linked by a brush over the years.
+
+    ``factors_view`` has a row per year (the bars sum the brushed years) or,
+    from ``factor_totals``, per risk factor (the bars ignore the brush).
+    """
+    # Year selection
+    brush = alt.selection_interval(encodings=['x'])
+    years = alt.Chart(deaths_totals).mark_line().add_selection(
+        brush
+    ).encode(
+        alt.X('year:O', title='Year'),
+        alt.Y('total:Q', title='Smoking Deaths (all ages)')
+    ).properties(
+    	width=400,
+        height=100
+    )
+
+    # Area chart - Smoking deaths by ages, drawn from the precomputed bands:
+    # the brush only drops years, nothing is stacked in the browser
+    base = alt.Chart(deaths_bands).mark_area().transform_filter(
+        brush
+    ).encode(
+        alt.X('year:O', title='Year'),
+        y=alt.Y('lower:Q', title='Smoking Deaths by Ages (normalized)',
+                scale=alt.Scale(domain=[0, 1]), axis=alt.Axis(format='%')),
+        y2='upper:Q',
+        color=alt.Color('Age:O', scale=alt.Scale(scheme='lightorange')),
+        tooltip=['Age:O', alt.Tooltip('share:Q', format='.1%')],
+        text='Age:O'
+    ).properties(
+        width=400,
+        height=200
+    )
+
+    # Bar chart - Risk factors
+    bar_factors = alt.Chart(factors_view).mark_bar().transform_filter(
+        alt.datum.country == selectCountry
+    )
+    if 'year' in factors_view:
+        bar_factors = bar_factors.transform_filter(brush)
+    bar_factors = bar_factors.encode(
+        alt.X('sum(value):Q', title='Total deaths'),
+        y=alt.Y('Risk Factor:O',sort='-x'),
+        tooltip='sum(value):Q',
+        color=alt.condition(
+          alt.datum['Risk Factor'] == 'Smoking',
+          alt.value("red"),  # Smoking color
+          alt.value("lightgray")  # Other than smoking
+        )
+    ).properties(
+        width=200,
+        height=400
+    )
+    return base, years, bar_factors
+
+
+def layout(base, years, bar_factors):
+    """The section's charts side by side, with its legend and title style."""
+    return (alt.hconcat(alt.vconcat(base,years)
+                        .properties(spacing=20), bar_factors)
+                        .configure_legend(orient='top-left', strokeColor='gray',
+                                        fillColor='#EEEEEE',
+                                        padding=5,
+                                        cornerRadius=10)
+                        .properties(spacing=20, autosize="pad")
+                        .configure_title(
+                                        align="center",
+                                        fontSize=20,
+                                        font='Arial',
+                                        color='black'))
+
+
+def country_chart(repo, country):
+    """The whole section for ``country``, from the rows of ``repo``."""
+    deaths_bands, deaths_totals = repo.age_stack(country)
+    factors_view = factors_long(repo.risk_factors(country))
+    return layout(*country_charts(deaths_bands, deaths_totals, factors_view, country))
@@ -0,0 +1,241 @@
+"""Static export of every dashboard view, for reports and read-only use.
+
+Renders the deaths section of every country, the control map of every
+metric and survey year and the scatter of every metric to a Vega-Lite spec
+(``.vl.json``) and a standalone HTML page, in a process pool, and indexes
+them in ``manifest.json``.
+
+The export runs offline: the CSVs and the world topology the control views
+load by URL are inlined from the local copies in data/ (as CSV text, parsed
+by Vega-Lite exactly as the fetched files would be). The HTML pages load
+Vega, Vega-Lite and vega-embed from ``--base-url``, a CDN by default; point
+it to a local copy for fully offline viewing.
+
+Every view is written atomically and views already on disk are skipped, so
+an interrupted export resumes where it stopped (``--force`` rebuilds all).
+The manifest, written first, records the version of every source file:
+when one has changed since, every view is rebuilt rather than mixing old and
+new data.
+
+Usage:
+    python export.py --output export [--workers 4] [--regions] [--force]
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import startup
+import datasets
+import compact
+import sql_store
+import repository
+import control_views
+import deaths_views
+
+alt = startup.lazy_import('altair')
+
+
+EXPORT_WORKERS = int(os.environ.get('TOBACCO_EXPORT_WORKERS', os.cpu_count() or 1))
+BASE_URL = 'https://cdn.jsdelivr.net/npm/'
+
+# URLs of the control views -> (dataset name, local file, Vega-Lite format)
+OFFLINE_DATA = {
+    control_views.control_dataset: ('control_policy', datasets.CONTROL_POLICY.path, {'type': 'csv'}),
+    control_views.deaths_dataset: ('control_deaths', datasets.CONTROL_DEATHS.path, {'type': 'csv'}),
+    control_views.url_topojson: ('world_countries', 'world-countries.json', None),
+}
+
+
+def slug(text):
+    return re.sub(r'[^a-z0-9]+', '-', str(text).lower()).strip('-')
+
+
+def view_keys(with_regions=False):
+    """Every view to export, deaths first."""
+    countries = repository.get_repository().countries('deaths')
+    return [('deaths', country) for country in countries] + control_views.all_keys(with_regions)
+
+
+def view_path(key):
+    """Path of a view's files relative to the output directory, without extension."""
+    return os.path.join(key[0], '-'.join(slug(part) for part in key[1:]))
+
+
+####### Specs
+
+def _inline_urls(spec, datasets_used):
+    # Swap every {"url": ...} of OFFLINE_DATA for a named reference to inlined data
+    if isinstance(spec, dict):
+        if spec.get('url') in OFFLINE_DATA:
+            name, _, csv_format = OFFLINE_DATA[spec['url']]
+            datasets_used.add(spec['url'])
+            reference = {'name': name}
+            if 'format' in spec or csv_format:
+                reference['format'] = spec.get('format', csv_format)
+            return reference
+        return {key: _inline_urls(value, datasets_used) for key, value in spec.items()}
+    if isinstance(spec, list):
+        return [_inline_urls(value, datasets_used) for value in spec]
+    return spec
+
+
+def offline_spec(spec):
+    """Copy of ``spec`` with the data it loads by URL inlined from local files."""
+    used = set()
+    spec = _inline_urls(spec, used)
+    for url in used:
+        name, path, csv_format = OFFLINE_DATA[url]
+        with open(path) as f:
+            spec.setdefault('datasets', {})[name] = f.read() if csv_format else json.load(f)
+    return spec
+
+
+def build_spec(key):
+    if key[0] == 'deaths':
+        with alt.data_transformers.enable('default', max_rows=None):
+            spec = deaths_views.country_chart(repository.get_repository(), key[1]).to_dict()
+        return compact.compact_spec(spec)
+    return offline_spec(control_views.build_spec(key)[1])
+
+
+def _write(path, text):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def export_view(key, output, base_url=BASE_URL):
+    """Write one view's spec and HTML page; returns its manifest entry (runs in the pool workers)."""
+    start = time.perf_counter()
+    spec = build_spec(key)
+    path = view_path(key)
+    os.makedirs(os.path.join(output, key[0]), exist_ok=True)
+    spec_text = json.dumps(spec, separators=(',', ':'))
+    html = alt.utils.html.spec_to_html(spec, mode='vega-lite', base_url=base_url,
+                                       vega_version=alt.VEGA_VERSION,
+                                       vegalite_version=alt.VEGALITE_VERSION,
+                                       vegaembed_version=alt.VEGAEMBED_VERSION)
+    _write(os.path.join(output, path + '.vl.json'), spec_text)
+    # The page last: a view counts as done once its HTML exists
+    _write(os.path.join(output, path + '.html'), html)
+    return _entry(key, output, time.perf_counter() - start)
+
+
+def _entry(key, output, seconds=None):
+    path = view_path(key)
+    return {'view': key[0],
+            'key': list(key[1:]),
+            'spec': path + '.vl.json',
+            'html': path + '.html',
+            'spec_bytes': os.path.getsize(os.path.join(output, path + '.vl.json')),
+            'seconds': seconds}
+
+
+def is_exported(key, output):
+    path = os.path.join(output, view_path(key))
+    return os.path.exists(path + '.vl.json') and os.path.exists(path + '.html')
+
+
+####### Export
+
+def source_versions():
+    return {dataset.name: sql_store.signature(dataset.path) for dataset in datasets.DATASETS.values()}
+
+
+def read_manifest(output):
+    try:
+        with open(os.path.join(output, 'manifest.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(output, manifest):
+    _write(os.path.join(output, 'manifest.json'), json.dumps(manifest, indent=1))
+
+
+def export(output, workers=EXPORT_WORKERS, with_regions=False, force=False, base_url=BASE_URL,
+           progress=None):
+    """Export every view missing from ``output``; returns the manifest."""
+    os.makedirs(output, exist_ok=True)
+    keys = view_keys(with_regions)
+    sources = source_versions()
+    previous = read_manifest(output)
+    # Views on disk only count when they were built from these same files
+    if previous is None or previous.get('sources') != sources:
+        force = True
+    entries = {} if force else {(entry['view'],) + tuple(entry['key']): entry
+                                for entry in previous.get('views', [])}
+    todo = [key for key in keys if force or not is_exported(key, output)]
+    # Before any view, so an interrupted export is resumed against the same files
+    _write_manifest(output, {'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                             'vega_lite': alt.SCHEMA_VERSION,
+                             'sources': sources,
+                             'complete': False,
+                             'views': list(entries.values())})
+    start = time.perf_counter()
+    seconds = {}
+
+    def _done(key, entry):
+        seconds[key] = entry['seconds']
+        if progress:
+            progress(len(seconds), len(todo), time.perf_counter() - start)
+
+    if workers <= 1:
+        for key in todo:
+            _done(key, export_view(key, output, base_url))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(export_view, key, output, base_url): key for key in todo}
+            for future in as_completed(futures):
+                _done(futures[future], future.result())
+    elapsed = time.perf_counter() - start
+
+    def entry(key):
+        # Skipped views keep their entry, and its timing, from the previous run
+        if key in seconds or key not in entries:
+            return _entry(key, output, seconds.get(key))
+        return entries[key]
+
+    manifest = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'vega_lite': alt.SCHEMA_VERSION,
+                'sources': sources,
+                'complete': True,
+                'exported': len(todo),
+                'skipped': len(keys) - len(todo),
+                'seconds': elapsed,
+                'views_per_second': len(todo) / elapsed if elapsed else None,
+                'views': [entry(key) for key in keys]}
+    _write_manifest(output, manifest)
+    return manifest
+
+
+def _print_progress(done, total, elapsed):
+    if done == total or done % 25 == 0:
+        print('%5d / %d views  %6.1f s  %6.1f views/s' % (done, total, elapsed, done / elapsed))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export every dashboard view as Vega-Lite and HTML.')
+    parser.add_argument('--output', default='export')
+    parser.add_argument('--workers', type=int, default=EXPORT_WORKERS)
+    parser.add_argument('--regions', action='store_true', help='also export the WHO-region maps')
+    parser.add_argument('--force', action='store_true', help='rebuild views already exported')
+    parser.add_argument('--base-url', default=BASE_URL, help='where the pages load the Vega libraries from')
+    args = parser.parse_args(argv)
+
+    manifest = export(args.output, args.workers, args.regions, args.force, args.base_url,
+                      progress=_print_progress)
+    print('%d views exported, %d already there, %.1f s (%s views/s)' % (
+        manifest['exported'], manifest['skipped'], manifest['seconds'],
+        '%.1f' % manifest['views_per_second'] if manifest['views_per_second'] else '-'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
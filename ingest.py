@@ -0,0 +1,176 @@
+"""Streaming ingestion of IHME / GBD risk-factor extracts.
+
+The OWID extract in data/ is small enough to melt in one go, but the full GBD
+exports add sex, age group and sub-national location dimensions and run to
+millions of rows. This module reads such a file in fixed-size chunks, maps
+the long ``Deaths - <factor> - Sex: ... - Age: ... (Number)`` headers to
+structured dimensions and folds every chunk into an aggregated cube, so peak
+memory depends on the chunk size and the size of the cube, never on the
+size of the input file. The default cube sums the years out, so its size
+only depends on the countries and measure columns; keeping ``year`` (or
+``location``) is an explicit choice.
+
+Sub-national rows are told apart by a ``locations`` mapping of each
+sub-national location to its country (``--locations``, a CSV of
+``location,country``). They are only read when the ``location`` dimension
+is kept: the rows of their country already count them.
+
+Usage:
+    python ingest.py data/number-of-deaths-by-risk-factor.csv --chunksize 100000 [--locations locations.csv]
+"""
+import re
+import sys
+import argparse
+
+import pandas as pd
+
+
+ID_COLUMNS = ['Entity', 'Code', 'Year']
+# 'location' is the row's entity, sub-national or not, 'country' the country it belongs to
+DIMENSIONS = ['location', 'country', 'year', 'Risk Factor', 'sex', 'age']
+DEFAULT_DIMENSIONS = ['country', 'Risk Factor', 'sex', 'age']
+
+# "Deaths - Smoking - Sex: Both - Age: All Ages (Number)"
+HEADER_PATTERN = re.compile(
+    r'^(?P<measure>.+?) - (?P<factor>.+?) - Sex: (?P<sex>.+?)'
+    r' - Age: (?P<age>.+?) \((?P<unit>[^()]+)\)$')
+# "Deaths – Outdoor air pollution (all ages) (IHME)"
+LEGACY_HEADER_PATTERN = re.compile(
+    r'^(?P<measure>.+?) [-–] (?P<factor>.+?) \((?P<age>[^()]+)\) \((?P<source>[^()]+)\)$')
+
+
+def parse_header(column):
+    """Map an extract column header to its measure/factor/sex/age/unit parts.
+
+    Returns None for columns that are not risk-factor measures.
+    """
+    match = HEADER_PATTERN.match(column.strip())
+    if match:
+        return match.groupdict()
+    match = LEGACY_HEADER_PATTERN.match(column.strip())
+    if match:
+        age = match.group('age')
+        return {'measure': match.group('measure'),
+                'factor': match.group('factor'),
+                'sex': 'Both',
+                'age': 'All Ages' if age.lower() == 'all ages' else age,
+                'unit': 'Number'}
+    return None
+
+
+def header_table(columns):
+    """Build a lookup frame from raw column headers to structured dimensions."""
+    rows = []
+    for column in columns:
+        if column in ID_COLUMNS:
+            continue
+        parts = parse_header(column)
+        if parts is not None:
+            rows.append(dict(parts, column=column))
+    table = pd.DataFrame(rows, columns=['column', 'measure', 'factor', 'sex', 'age', 'unit'])
+    return table.set_index('column')
+
+
+def _select_columns(table, measure, factors, sexes, ages):
+    mask = table['measure'] == measure
+    if factors is not None:
+        mask &= table['factor'].isin(factors)
+    if sexes is not None:
+        mask &= table['sex'].isin(sexes)
+    if ages is not None:
+        mask &= table['age'].isin(ages)
+    return table[mask]
+
+
+def read_locations(path):
+    """Sub-national location -> country mapping of a ``location,country`` CSV file."""
+    frame = pd.read_csv(path, usecols=['location', 'country'], dtype=str)
+    return dict(zip(frame['location'], frame['country']))
+
+
+def _aggregate_chunk(chunk, table, dimensions, locations):
+    if locations and 'location' not in dimensions:
+        chunk = chunk[~chunk['Entity'].isin(list(locations))]
+    # Wide to long for this chunk only, then attach the parsed dimensions
+    long = chunk.melt(id_vars=['Entity', 'Year'], value_vars=list(table.index),
+                      var_name='column', value_name='value')
+    long = long.dropna(subset=['value'])
+    dims = table.loc[long['column'], ['factor', 'sex', 'age']]
+    country = long['Entity']
+    if locations:
+        country = country.map(locations).fillna(country)
+    long = pd.DataFrame({
+        'location': long['Entity'].to_numpy(),
+        'country': country.to_numpy(),
+        'year': long['Year'].to_numpy(),
+        'Risk Factor': dims['factor'].to_numpy(),
+        'sex': dims['sex'].to_numpy(),
+        'age': dims['age'].to_numpy(),
+        'value': long['value'].to_numpy()})
+    return long.groupby(dimensions, sort=False)['value'].sum()
+
+
+def stream_risk_factors(path, chunksize=100000, measure='Deaths', factors=None,
+                        sexes=None, ages=None, dimensions=None, locations=None):
+    """Aggregate a wide IHME extract into a cube, reading ``chunksize`` rows at a time.
+
+    ``dimensions`` is the subset of DIMENSIONS kept in the cube (default:
+    DEFAULT_DIMENSIONS, the others are summed out); ``factors``, ``sexes`` and
+    ``ages`` restrict which measure columns are parsed at all. ``locations``
+    maps sub-national locations to their country. The result is a Series
+    indexed by ``dimensions``.
+    """
+    dimensions = list(dimensions or DEFAULT_DIMENSIONS)
+    unknown = set(dimensions) - set(DIMENSIONS)
+    if unknown:
+        raise ValueError('Unknown cube dimensions: %s' % ', '.join(sorted(unknown)))
+
+    header = pd.read_csv(path, nrows=0).columns
+    table = _select_columns(header_table(header), measure, factors, sexes, ages)
+    if table.empty:
+        raise ValueError('No %r columns found in %s' % (measure, path))
+
+    dtype = {column: 'float64' for column in table.index}
+    dtype.update({'Entity': str, 'Year': 'int64'})
+    reader = pd.read_csv(path, usecols=['Entity', 'Year'] + list(table.index),
+                         dtype=dtype, chunksize=chunksize)
+
+    cube = None
+    for chunk in reader:
+        partial = _aggregate_chunk(chunk, table, dimensions, locations)
+        # Fold into the running cube, aligned on its keys without regrouping it
+        cube = partial if cube is None else cube.add(partial, fill_value=0)
+    if cube is None:
+        cube = pd.Series([], dtype='float64', name='value',
+                         index=pd.MultiIndex.from_arrays([[]] * len(dimensions), names=dimensions))
+    return cube.sort_index()
+
+
+def to_long(cube):
+    """Flatten a cube to the long frame used by the dashboard charts."""
+    return cube.rename('value').reset_index()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Aggregate an IHME risk-factor extract in chunks.')
+    parser.add_argument('path')
+    parser.add_argument('--chunksize', type=int, default=100000)
+    parser.add_argument('--measure', default='Deaths')
+    parser.add_argument('--dimensions', nargs='+', default=DEFAULT_DIMENSIONS, choices=DIMENSIONS)
+    parser.add_argument('--locations', help='CSV of location,country mapping sub-national locations')
+    parser.add_argument('--output', help='write the aggregated cube to this CSV file')
+    args = parser.parse_args(argv)
+
+    locations = read_locations(args.locations) if args.locations else None
+    cube = stream_risk_factors(args.path, chunksize=args.chunksize, measure=args.measure,
+                               dimensions=args.dimensions, locations=locations)
+    if args.output:
+        to_long(cube).to_csv(args.output, index=False)
+    else:
+        print(to_long(cube).head(20).to_string(index=False))
+        print('%d cells over %s' % (len(cube), ', '.join(cube.index.names)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
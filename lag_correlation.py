@@ -0,0 +1,202 @@
+"""Lagged correlation between cigarette sales and smoking deaths.
+
+How many years after cigarette sales change do smoking deaths follow? For
+every country of both tables, ``correlate`` aligns the sales per adult
+(``NumCig``) and the smoking deaths of all ages on one country x year grid
+and correlates sales in year t with deaths in year t + lag, for every lag
+from 0 to MAX_LAG, in one batched NumPy pass. Years missing from either
+table are masked out, so the ragged coverage of the countries (sales from
+1875 for some, a decade for others; deaths from 1990) needs no loop over
+countries. A correlation needs at least MIN_PAIRS years of both.
+
+Levels mostly correlate the long-term trends; ``change=True`` correlates the
+year-over-year changes instead.
+
+Usage:
+    python lag_correlation.py [--change] [--max-lag 30]
+"""
+import sys
+import argparse
+
+import startup
+import loaders
+import payload
+
+alt = startup.lazy_import('altair')
+np = startup.lazy_import('numpy')
+pd = startup.lazy_import('pandas')
+
+
+MAX_LAG = 30
+MIN_PAIRS = 10
+
+
+def align(sales, deaths):
+    """Sales and deaths of the countries of both on one dense grid.
+
+    ``sales`` has ``Country``, ``Year`` and ``NumCig``; ``deaths`` has
+    ``country``, ``year`` and ``total``. Returns the sorted countries, the
+    years and two (countries x years) arrays, NaN where a table has no row.
+    """
+    countries = np.array(sorted(set(sales['Country']) & set(deaths['country'])), dtype=object)
+    sales = sales[sales['Country'].isin(countries)]
+    deaths = deaths[deaths['country'].isin(countries)]
+    first = min(sales['Year'].min(), deaths['year'].min())
+    last = max(sales['Year'].max(), deaths['year'].max())
+    years = np.arange(first, last + 1)
+
+    def grid(country, year, value):
+        values = np.full((len(countries), len(years)), np.nan)
+        values[np.searchsorted(countries, country.to_numpy()), year.to_numpy() - first] = value.to_numpy()
+        return values
+
+    return (countries, years,
+            grid(sales['Country'], sales['Year'], sales['NumCig']),
+            grid(deaths['country'], deaths['year'], deaths['total']))
+
+
+def year_over_year(values):
+    """Change from the previous year along the year axis, NaN unless both years are known."""
+    return np.concatenate([np.full((len(values), 1), np.nan), np.diff(values, axis=1)], axis=1)
+
+
+def lagged_correlation(x, y, max_lag=MAX_LAG, min_pairs=MIN_PAIRS):
+    """Pearson correlation of ``x[:, t]`` with ``y[:, t + lag]`` for lags 0 to ``max_lag``.
+
+    ``x`` and ``y`` are (countries x years) arrays with NaN for missing years.
+    Returns the lags, the correlations and the number of paired years, both
+    (countries x lags); correlations of fewer than ``min_pairs`` pairs are NaN.
+    """
+    lags = np.arange(max_lag + 1)
+    padded = np.concatenate([y, np.full((len(y), max_lag), np.nan)], axis=1)
+    # y shifted by every lag at once: countries x lags x years
+    shifted = padded[:, np.arange(x.shape[1])[None, :] + lags[:, None]]
+    x = np.broadcast_to(x[:, None, :], shifted.shape)
+    mask = ~np.isnan(x) & ~np.isnan(shifted)
+    pairs = mask.sum(axis=2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dx = np.where(mask, x, 0.0)
+        dy = np.where(mask, shifted, 0.0)
+        dx = np.where(mask, dx - dx.sum(axis=2, keepdims=True) / pairs[..., None], 0.0)
+        dy = np.where(mask, dy - dy.sum(axis=2, keepdims=True) / pairs[..., None], 0.0)
+        r = (dx * dy).sum(axis=2) / np.sqrt((dx * dx).sum(axis=2) * (dy * dy).sum(axis=2))
+    r = np.clip(r, -1.0, 1.0)
+    r[(pairs < min_pairs) | ~np.isfinite(r)] = np.nan
+    return lags, r, pairs
+
+
+def death_totals(deaths):
+    """``country``, ``year`` and ``total`` of a wide deaths-by-age frame."""
+    return pd.DataFrame({'country': deaths['country'],
+                         'year': deaths['year'],
+                         'total': deaths.loc[:, loaders.AGE_GROUPS].sum(axis=1, min_count=1)})
+
+
+def correlate(sales, deaths, change=False, max_lag=MAX_LAG):
+    """Correlations of every country and lag, see ``lagged_correlation``.
+
+    Returns a dict of ``country`` (countries), ``lag`` (lags), ``r`` and
+    ``pairs`` (countries x lags) arrays.
+    """
+    countries, _, x, y = align(sales, deaths)
+    if change:
+        x, y = year_over_year(x), year_over_year(y)
+    lags, r, pairs = lagged_correlation(x, y, max_lag)
+    return {'country': countries, 'lag': lags, 'r': r, 'pairs': pairs}
+
+
+def best_lags(result):
+    """One row per country: the lag with the highest correlation, its correlation and pairs.
+
+    Countries without any correlation (too few paired years) are left out.
+    """
+    known = ~np.isnan(result['r']).all(axis=1)
+    r = result['r'][known]
+    best = np.nanargmax(r, axis=1)
+    rows = np.arange(len(r))
+    return pd.DataFrame({'Country': result['country'][known],
+                         'lag': result['lag'][best],
+                         'correlation': r[rows, best],
+                         'pairs': result['pairs'][known][rows, best]})
+
+
+def correlation_frame(result):
+    """Long frame of every known correlation: ``Country``, ``lag``, ``correlation``, ``pairs``."""
+    countries, lags = len(result['country']), len(result['lag'])
+    frame = pd.DataFrame({'Country': np.repeat(result['country'], lags),
+                          'lag': np.tile(result['lag'], countries),
+                          'correlation': result['r'].ravel(),
+                          'pairs': result['pairs'].ravel()})
+    return frame[frame['correlation'].notna()].reset_index(drop=True)
+
+
+####### Cache
+
+# (source, change) -> (compute, result)
+_results = {}
+
+
+def cached(source, change, compute):
+    """``compute()`` cached per ``(source, change)``."""
+    entry = _results.get((source, change))
+    if entry is None:
+        entry = _results.setdefault((source, change), (compute, compute()))
+    return entry[1]
+
+
+def update():
+    """Recompute every cached result from the current tables (refresh.py), replacing it in place."""
+    for key, (compute, _) in list(_results.items()):
+        _results[key] = (compute, compute())
+
+
+def clear_caches():
+    _results.clear()
+
+
+####### View
+
+def best_lag_chart(result, notices=None):
+    """Correlation of every country and lag as a heatmap, the best lag of each country circled.
+
+    The heatmap data goes through ``payload.guard``, whose ``notices`` are
+    appended to the list ``notices``.
+    """
+    # Two decimals, as in the tooltip, are as many as the color scale shows
+    cells = payload.guard('Lag correlations', correlation_frame(result), reductions=[
+        ('correlations to 2 decimals', lambda frame: frame.assign(correlation=frame['correlation'].round(2)))],
+        group='Country', notices=notices)
+    best = best_lags(result)
+    best = best[best['Country'].isin(cells['Country'])]
+    countries = best.sort_values(['lag', 'Country'])['Country'].tolist()
+    y = alt.Y('Country:N', sort=countries, title=None)
+    heatmap = alt.Chart(cells).mark_rect().encode(
+        alt.X('lag:O', title='Years from sales to deaths'),
+        y,
+        color=alt.Color('correlation:Q', scale=alt.Scale(scheme='redblue', domain=[-1, 1], reverse=True),
+                        title='Correlation'),
+        tooltip=['Country', 'lag', alt.Tooltip('correlation:Q', format='.2f'), 'pairs']
+    )
+    marks = alt.Chart(best).mark_point(color='black', size=60).encode(
+        alt.X('lag:O'),
+        y,
+        tooltip=['Country', alt.Tooltip('lag', title='best lag'),
+                 alt.Tooltip('correlation:Q', format='.2f'), 'pairs']
+    )
+    return (heatmap + marks).properties(width=600, height=max(12 * len(countries), 100))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Best lag between cigarette sales and smoking deaths per country.')
+    parser.add_argument('--change', action='store_true', help='correlate year-over-year changes')
+    parser.add_argument('--max-lag', type=int, default=MAX_LAG)
+    args = parser.parse_args(argv)
+
+    result = correlate(loaders.load_sales(), death_totals(loaders.load_deaths()),
+                       args.change, args.max_lag)
+    print(best_lags(result).to_string(index=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
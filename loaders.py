@@ -0,0 +1,94 @@
+"""Cached loaders for the datasets in data/.
+
+Shared by the dashboard (main.py) and the tools running next to it, so every
+consumer parses a file at most once per process. The returned frames are
+cached objects: transform them into new frames, never modify them in place.
+refresh.py swaps a cached frame for an updated one with ``install``.
+"""
+import functools
+import threading
+
+import datasets
+from datasets import DATA_DIR, AGE_GROUPS, RISK_FACTORS, CONTROL_METRICS
+
+
+DEATHS_PATH = datasets.DEATHS.path
+FACTORS_PATH = datasets.FACTORS.path
+SALES_PATH = datasets.SALES.path
+CONTROL_PATH = datasets.CONTROL_POLICY.path
+CONTROL_DEATHS_PATH = datasets.CONTROL_DEATHS.path
+
+
+# loader name -> cached frame
+_frames = {}
+
+
+def cached(parse):
+    """Cache the frame returned by ``parse`` for the process, like lru_cache.
+
+    Unlike lru_cache the cached frame can be swapped with ``install``, so
+    readers never see an empty cache while a refreshed frame is built.
+    """
+    name = parse.__name__
+    # Sections loading concurrently wait for one parse instead of each parsing the file
+    lock = threading.Lock()
+
+    @functools.wraps(parse)
+    def load():
+        frame = _frames.get(name)
+        if frame is None:
+            with lock:
+                frame = _frames.get(name)
+                if frame is None:
+                    frame = _frames.setdefault(name, parse())
+        return frame
+
+    load.parse = parse
+    load.is_loaded = lambda: name in _frames
+    load.install = lambda frame: _frames.__setitem__(name, frame)
+    load.cache_clear = lambda: _frames.pop(name, None)
+    return load
+
+
+@cached
+def load_deaths():
+    """Smoking deaths by age group, one row per country and year."""
+    return datasets.read(datasets.DEATHS)
+
+
+@cached
+def load_factors():
+    """Deaths by risk factor, one row per country and year."""
+    return datasets.read(datasets.FACTORS)
+
+
+@cached
+def load_sales():
+    """Cigarettes sold per adult per day."""
+    return datasets.read(datasets.SALES)
+
+
+@cached
+def load_control_policy():
+    """WHO control policy scores, one row per country and survey year."""
+    return datasets.read(datasets.CONTROL_POLICY)
+
+
+@cached
+def load_control_deaths():
+    """Smoking deaths joined to the control policy table by ID."""
+    return datasets.read(datasets.CONTROL_DEATHS)
+
+
+# Registry name -> loader
+LOADERS = {datasets.DEATHS.name: load_deaths,
+           datasets.FACTORS.name: load_factors,
+           datasets.SALES.name: load_sales,
+           datasets.CONTROL_POLICY.name: load_control_policy,
+           datasets.CONTROL_DEATHS.name: load_control_deaths}
+
+
+def clear_caches():
+    for loader in (load_deaths, load_factors, load_sales,
+                   load_control_policy, load_control_deaths):
+        loader.cache_clear()
@@ -1,6 +1,85 @@
-import altair as alt
+import os
+
 import streamlit as st
-import pandas as pd
+
+import startup
+
+# Lazy in this module graph, which the tools share; under `streamlit run` both are
+# already loaded, Streamlit 0.72 imports them itself before this script starts
+alt = startup.lazy_import('altair')
+pd = startup.lazy_import('pandas')
+
+import client_side
+import compact
+import loaders
+import query_api
+import memory_accounting
+import payload
+import control_views
+import deaths_views
+import lag_correlation
+import progressive
+import repository
+import sales_trends
+import refresh
+
+# Read-only JSON API over the same cached datasets, for other internal tools
+if os.environ.get('TOBACCO_QUERY_API_PORT'):
+    query_api.start_in_background(port=int(os.environ['TOBACCO_QUERY_API_PORT']))
+
+# Replaced CSVs in data/ are diffed and applied to the caches of this server in place
+refresh.start_watcher()
+
+# Every section query goes through the repository, pandas frames or the SQLite store
+repo = repository.get_repository()
+
+# Memory attributed to each load, chart-build and render stage of this rerun, and
+# sizes of its frames and charts
+memory = memory_accounting.MemoryAccount().start()
+
+# Every section draws its text and placeholders now and is prepared in the background,
+# its placeholders are filled at the end of the script as soon as it is ready.
+# tracemalloc cannot tell threads apart: while accounting, the sections are prepared
+# one after the other on this thread, so that each stage only holds its own allocations
+sections = progressive.Sections(progressive.InlineExecutor() if memory.enabled else None)
+
+LOADING = 'Loading...'
+
+
+def stage(name, kind, function):
+    """``function`` ending memory stage ``name`` (run serially while accounting, see above)."""
+    def run(*args):
+        result = function(*args)
+        memory.checkpoint(name, kind)
+        return result
+    return run
+
+
+def draw(name, slot, notices=(), notice_slot=None):
+    """Callback showing a section's chart (or spec) in its placeholder ``slot``.
+
+    ``notices`` is the list given to ``payload.guard`` while building the
+    chart; they are shown in ``notice_slot``, under the chart.
+    """
+    def show(chart):
+        memory.chart(name, chart)
+        # Rounded, CSV-encoded data inlined in the views, which st.altair_chart would
+        # turn back into DataFrame messages
+        slot.vega_lite_chart(compact.chart_spec(chart))
+        if notices:
+            notice_slot.warning(' '.join(notices))
+        memory.checkpoint(name + ' render', 'render')
+    return show
+
+
+def draw_spec(name, slot):
+    """Like ``draw``, for a spec already built by ``compact.chart_spec`` (see client_side.cached)."""
+    def show(spec):
+        memory.chart(name, spec)
+        slot.vega_lite_chart(spec)
+        memory.checkpoint(name + ' render', 'render')
+    return show
+
 
 st.title("Tobacco: a silent killer")
 
@@ -19,169 +98,71 @@ st.header("Smoking Deaths from 1990 to 2017")
 	In the bar chart on the right, we can see how smoking ranks in the list of risk factors that lead to deaths in the chosen country in the chosen period of time.
 '''
 
-deaths = pd.read_csv('data/smoking-deaths-by-age.csv',
-                    header=0,
-                    names=[
-                        'country',
-                        'code',
-                        'year',
-                        '15 to 49',
-                        '50 to 69',
-                        'Above 70'])
-factors = pd.read_csv('data/number-of-deaths-by-risk-factor.csv',
-                    header=0,
-                    index_col=False,
-                    names=[
-                        'country',
-                        'code',
-                        'year',
-                        'Diet low in vegetables',
-                        'Diet low in whole grains',
-                        'Diet low in nuts and seeds',
-                        'Diet low in calcium',
-                        'Unsafe sex',
-                        'No access to handwashing facility',
-                        'Child wasting',
-                        'Child stunting',
-                        'Diet high in red meat',
-                        'Diet low in fiber',
-                        'Diet low in seafood omega-3 fatty acids',
-                        'Diet high in sodium',
-                        'Low physical activity',
-                        'Non-exclusive breastfeeding',
-                        'Discontinued breastfeeding',
-                        'Iron deficiency',
-                        'Vitamin A deficiency',
-                        'Zinc deficiency',
-                        'Smoking',
-                        'Secondhand smoke',
-                        'Alcohol use',
-                        'Drug use',
-                        'High fasting plasma glucose',
-                        'High total cholesterol', # Many null values
-                        'High systolic blood pressure',
-                        'High body-mass index',
-                        'Low bone mineral density',
-                        'Diet low in fruits',
-                        'Diet low in legumes',
-                        'Low birth weight for gestation',
-                        'Unsafe water source',
-                        'Unsafe sanitation',
-                        'Household air pollution from solid fuels',
-                        'Air pollution',
-                        'Outdoor air pollution'])
-
-# Convert data from wide to long
-deaths = pd.melt(deaths, id_vars=['country', 'year'], value_vars=['15 to 49', '50 to 69', 'Above 70'], var_name='Age')
-factors = pd.melt(factors, id_vars=['country', 'year'], value_vars=['Diet low in vegetables',
-                        'Diet low in nuts and seeds',
-                        'Diet low in calcium',
-                        'Unsafe sex',
-                        'No access to handwashing facility',
-                        'Child wasting',
-                        'Child stunting',
-                        'Diet high in red meat',
-                        'Diet low in fiber',
-                        'Diet low in seafood omega-3 fatty acids',
-                        'Diet high in sodium',
-                        'Low physical activity',
-                        'Non-exclusive breastfeeding',
-                        'Discontinued breastfeeding',
-                        'Iron deficiency',
-                        'Vitamin A deficiency',
-                        'Zinc deficiency',
-                        'Smoking',
-                        'Secondhand smoke',
-                        'Alcohol use',
-                        'Drug use',
-                        'High fasting plasma glucose',
-                        'High total cholesterol', # Many null values
-                        'High systolic blood pressure',
-                        'High body-mass index',
-                        'Low bone mineral density',
-                        'Diet low in fruits',
-                        'Diet low in legumes',
-                        'Low birth weight for gestation',
-                        'Unsafe water source',
-                        'Unsafe sanitation',
-                        'Household air pollution from solid fuels',
-                        'Air pollution',
-                        'Outdoor air pollution'], var_name='Risk Factor')
-
-# Country Selection
-countries = deaths['country'].unique() # get unique country names
-countries.sort() # sort alphabetically
-selectCountry = st.selectbox('Select a country: ', countries)
-
-# selectCountry = alt.selection_single(
-#     name='Select', # name the selection 'Select'
-#     fields=['country'], # limit selection to the country field
-#     init={'country': countries[0]}, # use first country entry as initial value
-#     bind=alt.binding_select(options=countries) # bind to a menu of unique country values
-# )
-
-# Year selection
-brush = alt.selection_interval(encodings=['x'])
-years = alt.Chart(deaths).mark_line().add_selection(
-    brush
-).transform_filter(
-    alt.datum.country == selectCountry
-).encode(
-    alt.X('year:O', title='Year'),
-    alt.Y('sum(value)', title='Smoking Deaths (all ages)')
-).properties(
-	width=400,
-    height=100
-)
-
-# Area chart - Smoking deaths by ages
-base = alt.Chart(deaths).mark_area().transform_filter(
-    alt.datum.country == selectCountry
-).transform_filter(
-    brush
-).encode(
-    alt.X('year:O', title='Year'),
-    y=alt.Y('value:Q', title='Smoking Deaths by Ages (normalized)', stack="normalize"),
-    color=alt.Color('Age:O', scale=alt.Scale(scheme='lightorange')),
-    tooltip='Age:O',
-    text='Age:O'
-).properties(
-    width=400,
-    height=200
-)
-
-# Bar chart - Risk factors
-bar_factors = alt.Chart(factors).mark_bar().transform_filter(
-    alt.datum.country == selectCountry
-).transform_filter(
-    brush
-).encode(
-    alt.X('sum(value):Q', title='Total deaths'),
-    y=alt.Y('Risk Factor:O',sort='-x'),
-    tooltip='sum(value):Q',
-    color=alt.condition(
-      alt.datum['Risk Factor'] == 'Smoking',
-      alt.value("red"),  # Smoking color
-      alt.value("lightgray")  # Other than smoking
-    )
-).properties(
-    width=200,
-    height=400
-)
-
-# Visualize
-st.altair_chart(alt.hconcat(alt.vconcat(base,years)
-                            .properties(spacing=20), bar_factors)
-                            .configure_legend(orient='top-left', strokeColor='gray',
-                                            fillColor='#EEEEEE',
-                                            padding=5,
-                                            cornerRadius=10)
-                            .properties(spacing=20, autosize="pad")
-                            .configure_title(
-                                            align="center",
-                                            fontSize=20,
-                                            font='Arial',
-                                            color='black'))
+age_groups = loaders.AGE_GROUPS
+risk_factors = loaders.RISK_FACTORS
+
+deaths_widget = st.empty()
+deaths_slot = st.empty()
+deaths_slot.text(LOADING)
+deaths_notice = st.empty()
+
+
+def prepare_deaths():
+    """The section's spec if it runs client-side, else the countries of its dropdown."""
+    # Ship the whole section to the browser when the compact payload is small enough,
+    # the country dropdown and the brush then run without any rerun of this script.
+    # Only considered for the in-memory backend, the SQL store never loads whole tables
+    if repo.in_memory:
+        # Compact per-country payloads for the client-side mode, and its spec when they fit,
+        # built and measured once per data version
+        (deaths_client, factors_client), size, deaths_spec = client_side.cached(
+            'deaths', lambda: client_side.deaths_payload(repo.deaths(), repo.risk_factors()),
+            lambda deaths, factors: deaths_views.layout(*client_side.deaths_charts(
+                deaths, factors, age_groups, risk_factors)))
+        memory.frame('deaths (client)', deaths_client)
+        memory.frame('factors (client)', factors_client)
+        if deaths_spec is not None:
+            return deaths_spec, None
+    return None, repo.countries('deaths') # sorted unique country names
+
+
+def prepare_deaths_country(selectCountry, notices):
+    # Only the selected country is drawn, so only its rows are queried and converted
+    # from wide to long (deaths by age stay wide, see age_stacks)
+    factors = deaths_views.factors_long(repo.risk_factors(selectCountry))
+    memory.frame('factors (long)', factors)
+    # The bars sum their rows: never sampled, totaled over every year if need be
+    factors_view = payload.guard('Risk factors', factors, reductions=[
+        ('per-factor totals', deaths_views.factor_totals,
+         'Risk factors: too much data for one bar per year, the bars show every year, whatever the chosen period.')],
+        group=['country', 'Risk Factor'], sample=False, notices=notices)
+
+    # selectCountry = alt.selection_single(
+    #     name='Select', # name the selection 'Select'
+    #     fields=['country'], # limit selection to the country field
+    #     init={'country': countries[0]}, # use first country entry as initial value
+    #     bind=alt.binding_select(options=countries) # bind to a menu of unique country values
+    # )
+
+    # Age shares, stack offsets and yearly totals of the selected country, precomputed once
+    deaths_bands, deaths_totals = repo.age_stack(selectCountry)
+    memory.frame('deaths (stacked bands)', deaths_bands)
+
+    # Visualize
+    return deaths_views.layout(*deaths_views.country_charts(deaths_bands, deaths_totals,
+                                                            factors_view, selectCountry))
+
+
+def show_deaths(prepared):
+    deaths_spec, countries = prepared
+    if deaths_spec is not None:
+        draw_spec('deaths', deaths_slot)(deaths_spec)
+    else:
+        # Country Selection
+        selectCountry = deaths_widget.selectbox('Select a country: ', countries)
+        notices = []
+        sections.submit(stage('deaths chart', 'chart', prepare_deaths_country), selectCountry, notices,
+                        then=draw('deaths', deaths_slot, notices, deaths_notice))
 
 
 
@@ -189,21 +170,6 @@ st.altair_chart(alt.hconcat(alt.vconcat(base,years)
 #########################################################
 #############       tobacco_sales.py        #############
 #########################################################
-sales_data = pd.read_csv('data/sales-of-cigarettes-per-adult-per-day.csv',
-                    header=0,
-                    names=[
-                        'Country',
-                        'Code',
-                        'Year',
-                        'NumCig'
-                    ],
-                    dtype={'Country': str,
-                            'Code': str,
-                            'Year': 'Int64',
-                            'NumCig': 'float64'})
-
-sales_minyear = sales_data.loc[:, 'Year'].min()
-sales_maxyear = sales_data.loc[:, 'Year'].max()
 
 container = st.beta_container()
 with container:
@@ -211,35 +177,102 @@ with container:
     '''
     This chart below shows average number of cigarettes sold per day in a particular country.
     For example, in 1980 in France, people used to buy on average 6 cigarettes per day.
+    The smoothed mode draws each year's mean over the last few years instead, and the triangles mark the year of highest sales.
     '''
-    sales_bycountry = st.multiselect('Select countries to plot',
-                           sales_data.groupby('Country').count().reset_index()['Country'].tolist(),
-                           default=['France', 'Germany', 'Spain'])
-
-
-slider = st.slider('Select a period to plot', int(str(sales_minyear)), int(str(sales_maxyear)), (1980, 2000))
-sales_chart = alt.Chart(sales_data, height=500, width=700,
-title='Average number of cigarettes sold daily during chosen period of time').mark_line().encode(
-alt.X('Year', axis=alt.Axis(title='Years', tickCount=5)),
-alt.Y('NumCig', axis=alt.Axis(title='Avg daily sales of cigarretes')),
-alt.Color('Country')
-).transform_filter(
-    {'and': [{'field': 'Country', 'oneOf': sales_bycountry},
-            {'field': 'Year', 'range': slider}]}
+sales_widget = container.empty()
+sales_mode_widget = container.empty()
+sales_slot = container.empty()
+sales_slot.text(LOADING)
+sales_notice = container.empty()
+sales_period = st.empty()
+
+
+def prepare_sales():
+    """The section's spec if it runs client-side, else the countries and years of its widgets."""
+    sales_years = repo.sales_years()
+    # Same as the deaths section, whole tables only go to the browser from the in-memory backend
+    if repo.in_memory:
+        # Raw series, rolling means, yearly changes and peaks, precomputed once for every country
+        # Countries are picked in the chart legend, the period with the sliders below it
+        (sales_client,), size, sales_spec = client_side.cached(
+            'sales', lambda: (client_side.sales_payload(repo.sales_trends()),),
+            lambda sales: client_side.sales_chart(sales, ['France', 'Germany', 'Spain'], (1980, 2000)))
+        memory.frame('sales', sales_client)
+        if sales_spec is not None:
+            return sales_spec, None, None
+    return None, repo.countries('sales'), sales_years
+
+
+def prepare_sales_chart(sales_bycountry, slider, sales_mode, notices):
+    # The rows carry both series, the mode only picks the column drawn
+    # (the raw series stays for the tooltip)
+    unused = [column for column in sales_trends.MODES.values()
+              if column not in (sales_trends.MODES[sales_mode], 'NumCig')]
+    sales_view = payload.guard('Sales', repo.sales_trends(sales_bycountry, slider), reductions=[
+        ('the drawn series only', lambda frame: frame.drop(columns=unused))],
+        group='Country', notices=notices)
+    base = alt.Chart(sales_view).encode(
+    alt.X('Year', axis=alt.Axis(title='Years', tickCount=5)),
+    alt.Y(sales_trends.MODES[sales_mode], axis=alt.Axis(title='Avg daily sales of cigarretes')),
+    alt.Color('Country')
     )
-with container:
+    peaks = base.mark_point(shape='triangle-up', filled=True, size=80).transform_filter(
+        alt.datum.peak
+    ).encode(
+        tooltip=['Country', 'Year', 'NumCig', alt.Tooltip('yoy:Q', title='change from previous year')]
+    )
+    return alt.layer(base.mark_line(), peaks, height=500, width=700,
+    title='Average number of cigarettes sold daily during chosen period of time').transform_filter(
+        {'and': [{'field': 'Country', 'oneOf': sales_bycountry},
+                {'field': 'Year', 'range': slider}]}
+        )
+
+
+def show_sales(prepared):
+    sales_spec, sales_countries, sales_years = prepared
+    if sales_spec is not None:
+        draw_spec('sales', sales_slot)(sales_spec)
+    else:
+        sales_minyear, sales_maxyear = sales_years
+        sales_bycountry = sales_widget.multiselect('Select countries to plot',
+                               sales_countries,
+                               default=['France', 'Germany', 'Spain'])
+        sales_mode = sales_mode_widget.radio('Show', list(sales_trends.MODES))
+        slider = sales_period.slider('Select a period to plot', int(str(sales_minyear)), int(str(sales_maxyear)), (1980, 2000))
+        notices = []
+        sections.submit(stage('sales chart', 'chart', prepare_sales_chart), sales_bycountry, slider, sales_mode, notices,
+                        then=draw('sales', sales_slot, notices, sales_notice))
+
+####### Lag between sales and deaths
+
+st.header('How long after sales do smoking deaths follow?')
+
+'''
+For each country with both sales and deaths data, the chart below correlates the cigarettes sold in a year
+with the smoking deaths 0 to 30 years later. The circle marks the lag with the strongest correlation.
+Levels mostly follow the long-term trends; correlating year-over-year changes instead isolates the shorter swings.
+'''
+
+lags_change = st.checkbox('Correlate year-over-year changes')
+lags_slot = st.empty()
+lags_slot.text(LOADING)
+lags_notice = st.empty()
+lags_notices = []
+
 
-    st.altair_chart(sales_chart)
+def prepare_lags(change, notices):
+    # Every country and lag in one batched pass, cached per process
+    return lag_correlation.best_lag_chart(repo.lag_correlations(change), notices)
 
 ###########################################################
 #############       tobacco_control.py        #############
 ###########################################################
 
 
-####### Datasets
-
-control_dataset = 'https://raw.githubusercontent.com/JulioCandela1993/VisualAnalytics/master/data/control_policy.csv'
-deaths_dataset = 'https://raw.githubusercontent.com/JulioCandela1993/VisualAnalytics/master/data/deaths.csv'
+# Every map and scatter spec of this section is built once per process, on demand or,
+# when enabled, all at once in a process pool; the widgets below then pick a cached spec
+if control_views.PRECOMPILE_ON_START:
+    control_views.precompile_in_background()
 
 ####### Dashboard
 
@@ -253,27 +286,13 @@ of a country to deal with Tobacco issues being 1 the worst and 5 the best
 
 ####### Control Measures given by WHO
 
-control_metrics = ["Monitor",	
-           "Protect from tobacco smoke",	
-           "Offer help to quit tobacco use", 
-           "Warn about the dangers of tobacco",
-           "Enforce bans on tobacco advertising",
-           "Raise taxes on tobacco",
-           "Anti-tobacco mass media campaigns"
-]
+control_metrics = loaders.CONTROL_METRICS
 
 container_map = st.beta_container()
 with container_map:
 
-    cols = st.selectbox('Select control measure: ', control_metrics)
-    
-    if cols in control_metrics:   
-        metric_to_show_in_covid_Layer = cols +":Q"
-        metric_name = cols
-       
-    years = ['2008', '2010', '2012', '2014', '2016', '2018']
-    columns_year = [metric_name+" "+str(year) for year in years]
-    columns = ["d" +str(year) for year in years]
+    metric_name = st.selectbox('Select control measure: ', control_metrics)
+    select_region = st.selectbox('Select WHO region: ', control_views.REGIONS)
     
     st.header("A global view of the implementation of control policies around the world")
 
@@ -282,65 +301,14 @@ with container_map:
     We can also see the evolution of these policies from 2008 to 2018
     '''
 
-
+map_slot = container_map.empty()
+map_slot.text(LOADING)
 
 
 ####### Map Visualization
 
-
-url_topojson = 'https://raw.githubusercontent.com/JulioCandela1993/VisualAnalytics/master/world-countries.json'
-data_topojson_remote = alt.topo_feature(url=url_topojson, feature='countries1')
-
 select_year = st.slider('Select period: ', 2008, 2018, 2008, step = 2)
 
-map_geojson = alt.Chart(data_topojson_remote).mark_geoshape(
-    stroke="black",
-    strokeWidth=1,
-    fill='lightgray'
-).encode(
-    color=metric_to_show_in_covid_Layer,
-).transform_lookup(
-        lookup="properties.name",
-        from_=alt.LookupData(control_dataset, "Country", [metric_name,"Year"])
-).properties(
-    width=800,
-    height=400
-)
-      
-choro = alt.Chart(data_topojson_remote).mark_geoshape(
-    stroke='black'
-).encode(
-    color=metric_to_show_in_covid_Layer,
-            tooltip=[
-                alt.Tooltip("properties.name:O", title="Country name"),
-                alt.Tooltip(metric_to_show_in_covid_Layer, title=metric_name),
-                alt.Tooltip("year:Q", title="Year"),
-            ],
-).transform_calculate(
-    d2008 = "1",
-    d2010 = "1",
-    d2012 = "1",
-    d2014 = "1",
-    d2016 = "1",
-    d2018 = "1"
-).transform_fold(
-    columns, as_=['year', 'metric']
-).transform_calculate(
-    yearQ = 'replace(datum.year,"d","")'
-).transform_calculate(
-    key_val = 'datum.properties.name + datum.yearQ'
-).transform_lookup(
-        lookup="key_val",
-        from_=alt.LookupData(control_dataset, "ID", [metric_name,"Year"])
-).transform_calculate(
-    year='parseInt(datum.Year)',
-).transform_filter(
-    alt.FieldEqualPredicate(field='year', equal=select_year)
-)
-
-with container_map:
-    st.altair_chart(map_geojson + choro)
-
 
 
 ####### Scatterplot control policy vs deaths
@@ -359,81 +327,21 @@ An increase in the efforts of a control policy should be reflected in a decrease
 the efficiency of the control measure
 '''
 
-brush = alt.selection_interval()
-
-base_scatter = alt.Chart(control_dataset).transform_lookup(
-        lookup="ID",
-        from_=alt.LookupData(deaths_dataset, "ID", ["deaths","Year"])
-).transform_calculate(
-    deaths='parseFloat(datum.deaths)',
-    year='parseInt(datum.Year)',
-    metric = alt.datum[metric_name]
-).transform_calculate(
-    deaths_2016='datum.year==2016?datum.deaths:0',
-    deaths_2008='datum.year==2008?datum.deaths:0',
-    metric_2016='datum.year==2016?datum.metric:0',
-    metric_2008='datum.year==2008?datum.metric:0',
-    year='parseInt(datum.Year)',
-).transform_aggregate(
-    deaths_2016='sum(deaths_2016)',
-    metric_2016='sum(metric_2016)',
-    deaths_2008='sum(deaths_2008)',
-    metric_2008='sum(metric_2008)',
-    groupby=["Country"]
-).transform_calculate(
-    incr_ratio_deaths='((datum.deaths_2016/datum.deaths_2008)-1)*100',
-    incr_ratio_metric='((datum.metric_2016/datum.metric_2008)-1)*100',
-)
-
-xscale = alt.Scale(domain=(-100, 400))
-yscale = alt.Scale(domain=(-100, 200))
-
-# area_args = {'opacity': .3, 'interpolate': 'step'}
-
-points_scatter = base_scatter.mark_circle().encode(
-    alt.X('incr_ratio_metric:Q', scale = xscale, title = '% change of efforts in ' + metric_name + ' from 2008 to 2016'),
-    alt.Y('incr_ratio_deaths:Q', scale=yscale, title = '% change in deaths from 2008 to 2016'),
-    #color=alt.condition(brush, alt.value('blue'), alt.value('lightgray')),  
-    
-    #opacity=alt.condition(brush, alt.value(0.75), alt.value(0.05)),
-    tooltip=[
-                alt.Tooltip("Country:N", title="Country"),
-            ],
-).properties(
-    width=600,
-    height=400
-).transform_filter(brush)   
-    
-regression_scatter = points_scatter.transform_regression(
-        on='incr_ratio_metric', regression='incr_ratio_deaths'#, method = 'log'
-).mark_line(color='orange')
+scatter_slot = st.empty()
+scatter_slot.text(LOADING)
 
-scatter_final = (points_scatter + regression_scatter)
-    
-top_hist = base_scatter.mark_area().encode(
-    alt.X("incr_ratio_metric:Q",
-          bin=alt.Bin(maxbins=10, extent=xscale.domain),
-          title=''
-          ),
-    alt.Y('count()', title='N° Countries'),
-    #alt.Color('Country:N'),
-).add_selection(
-    brush
-).properties(width=600 , height=80)
-
-right_hist = base_scatter.mark_area().encode(
-    alt.Y('incr_ratio_deaths:Q',
-          bin=alt.Bin(maxbins=20, extent=yscale.domain),
-          title='',
-          ),
-    alt.X('count()', title='N° Countries'),
-    #alt.Color('species:N'),
-).add_selection(
-    brush
-).properties(width=100, height=400)
-
-
-st.altair_chart(top_hist & (scatter_final |right_hist ))
+####### Prepare every section concurrently, drawing each one when it is ready
+
+memory.checkpoint('script', 'script')
+sections.submit(stage('load deaths', 'load', prepare_deaths), then=show_deaths)
+sections.submit(stage('load sales', 'load', prepare_sales), then=show_sales)
+sections.submit(stage('lags chart', 'chart', prepare_lags), lags_change, lags_notices,
+                then=draw('lags', lags_slot, lags_notices, lags_notice))
+sections.submit(stage('map chart', 'chart', control_views.map_spec), metric_name, select_year, select_region,
+                then=draw('map', map_slot))
+sections.submit(stage('scatter chart', 'chart', control_views.scatter_spec), metric_name,
+                then=draw('scatter', scatter_slot))
+sections.run()
 
 
 # st.altair_chart(right_hist)
@@ -531,3 +439,18 @@ st.altair_chart(top_hist & (scatter_final |right_hist ))
 
 # st.altair_chart(rect_countries + area_countries)
 
+
+####### Memory accounting
+
+memory.stop()
+if memory.enabled:
+    if memory_accounting.MEMORY_DUMP:
+        memory.to_json(memory_accounting.MEMORY_DUMP)
+    with st.beta_expander('Memory accounting (debug)'):
+        report = memory.report()
+        st.write('Peak traced memory this rerun: ' + memory_accounting.format_bytes(report['peak_bytes']) +
+                 (' (other sessions ran meanwhile and are included)' if report['overlapped'] else ''))
+        st.table(pd.DataFrame(report['stages']))
+        st.table(pd.DataFrame(report['frames']))
+        st.table(pd.DataFrame(report['charts']))
+        st.json(report)
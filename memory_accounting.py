@@ -0,0 +1,152 @@
+"""Per-stage memory accounting for a dashboard rerun, built on tracemalloc.
+
+A ``MemoryAccount`` attributes the memory allocated (and the peak reached)
+between two ``checkpoint`` calls to the stage named by the second one, and
+records deep sizes of the frames and serialized sizes of the charts it is
+shown. main.py creates one per rerun; it only traces when enabled, since
+tracemalloc slows every allocation down.
+
+tracemalloc counts the allocations of the whole process, not of a thread:
+stages are only meaningful when nothing else runs between two checkpoints.
+With accounting enabled, main.py prepares its sections one after the other
+(``progressive.InlineExecutor``) for a load, chart and render stage each.
+Tracing is shared by the accounts running at the same time (one per
+session rerun): it starts with the first and stops with the last, and the
+peak is only reset while one account runs alone. The report marks an
+account that ran alongside others as ``overlapped``, its figures then
+include their allocations.
+
+Enable with ``TOBACCO_MEMORY_DEBUG=1``; set ``TOBACCO_MEMORY_DUMP=<path>`` to
+also write each rerun's report as JSON.
+"""
+import os
+import json
+import time
+import threading
+import tracemalloc
+
+
+MEMORY_DEBUG = os.environ.get('TOBACCO_MEMORY_DEBUG', '0') == '1'
+MEMORY_DUMP = os.environ.get('TOBACCO_MEMORY_DUMP')
+
+# Accounts between start and stop, and whether one of them started tracemalloc
+_active = set()
+_active_lock = threading.Lock()
+_started_tracing = False
+
+
+class MemoryAccount:
+
+    def __init__(self, enabled=MEMORY_DEBUG):
+        self.enabled = enabled
+        self.stages = []
+        self.frames = []
+        self.charts = []
+        self.overlapped = False
+        self._last = 0
+        self._stage_peak = 0
+        self._peak = 0
+
+    def start(self):
+        global _started_tracing
+        if not self.enabled:
+            return self
+        with _active_lock:
+            if not _active and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _started_tracing = True
+            _active.add(self)
+            if len(_active) > 1:
+                for account in _active:
+                    account.overlapped = True
+        self._reset_peak()
+        self._last, self._peak = tracemalloc.get_traced_memory()
+        self._stage_peak = self._last
+        self._clock = time.perf_counter()
+        return self
+
+    def _reset_peak(self):
+        # The peak is process-wide: resetting it while another account runs would lose its peak.
+        # tracemalloc.reset_peak only exists on Python 3.9+
+        with _active_lock:
+            if _active == {self} and hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+
+    def checkpoint(self, name, kind='transform'):
+        """Attribute everything since the previous checkpoint to stage ``name``."""
+        if not self.enabled:
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        now = time.perf_counter()
+        peak = max(peak, self._stage_peak)
+        self.stages.append({'stage': name,
+                            'kind': kind,
+                            'allocated_bytes': current - self._last,
+                            'peak_bytes': peak,
+                            'seconds': now - self._clock})
+        self._peak = max(self._peak, peak)
+        self._last = self._stage_peak = current
+        self._clock = now
+        self._reset_peak()
+
+    def frame(self, name, frame):
+        """Record the deep in-memory size of a DataFrame."""
+        if not self.enabled:
+            return
+        self.frames.append({'frame': name,
+                            'rows': int(frame.shape[0]),
+                            'columns': int(frame.shape[1]),
+                            'deep_bytes': int(frame.memory_usage(index=True, deep=True).sum())})
+
+    def chart(self, name, chart):
+        """Record the size of a chart's Vega-Lite spec (or of a spec dict), plain and compacted."""
+        if not self.enabled:
+            return
+        import altair as alt
+        import compact
+        # Serializing allocates a lot; keep it out of the stage being measured
+        before, peak = tracemalloc.get_traced_memory()
+        self._stage_peak = max(self._stage_peak, peak)
+        clock = time.perf_counter()
+        with alt.data_transformers.enable('default', max_rows=None):
+            sizes = compact.savings(chart if isinstance(chart, dict) else chart.to_dict())
+        self.charts.append(dict({'chart': name}, **sizes))
+        self._last += tracemalloc.get_traced_memory()[0] - before
+        self._clock += time.perf_counter() - clock
+        self._reset_peak()
+
+    def stop(self):
+        global _started_tracing
+        if not self.enabled:
+            return self
+        with _active_lock:
+            if self not in _active:
+                return self
+            self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            _active.discard(self)
+            if not _active and _started_tracing:
+                tracemalloc.stop()
+                _started_tracing = False
+        return self
+
+    def report(self):
+        return {'enabled': self.enabled,
+                'overlapped': self.overlapped,
+                'peak_bytes': self._peak,
+                'stages': self.stages,
+                'frames': self.frames,
+                'charts': self.charts}
+
+    def to_json(self, path=None):
+        text = json.dumps(self.report(), indent=2)
+        if path:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+
+def format_bytes(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if abs(size) < 1024 or unit == 'GB':
+            return '%.1f %s' % (size, unit)
+        size /= 1024.0
@@ -0,0 +1,147 @@
+"""Guardrail on the size of the data inlined into chart specs.
+
+Every chart of the dashboard inlines its DataFrame into the Vega-Lite spec,
+so one unlucky widget choice can ship megabytes to the browser. ``guard``
+estimates the size of a chart's data, as the CSV ``compact.chart_spec``
+ships, before it is rendered and, above ``PAYLOAD_MAX_BYTES``, switches to
+reduced variants of the same view: first the exact ones given by the caller
+(fewer columns, pre-aggregated data), then an even per-series downsampling
+that always fits the budget. Summed measures are never row-sampled
+(``sample=False``): whole groups are dropped instead. Every switch is logged,
+and the ones the user can see are added to the caller's ``notices``.
+
+The control views read their rows by URL; the only data they inline is the
+fixed world outline behind the region maps, so no widget makes them grow.
+"""
+import os
+import math
+import logging
+
+import compact
+
+
+PAYLOAD_MAX_BYTES = int(os.environ.get('TOBACCO_PAYLOAD_MAX_BYTES', 500000))
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_bytes(frame, sample=200):
+    """Estimated size of ``frame`` as the CSV shipped to the browser, from a sample of its rows."""
+    rows = len(frame)
+    if rows <= sample:
+        return compact.csv_bytes(frame)
+    step = rows // sample
+    sampled = frame.iloc[::step]
+    return int(compact.csv_bytes(sampled) * rows / len(sampled))
+
+
+def downsample(frame, max_bytes, group=None):
+    """Keep every n-th row (and the last one) of each ``group``, n as small as fits ``max_bytes``.
+
+    Each group keeps at least its first and last rows, so with many groups
+    even the largest stride can be over budget: whole groups are then
+    dropped from the end (``drop_groups``) until the rest fits.
+    """
+    if group is None:
+        position = frame.reset_index(drop=True).index.to_series()
+        last = position == len(frame) - 1
+        largest = len(frame)
+    else:
+        grouped = frame.groupby(group, sort=False)
+        position = grouped.cumcount()
+        sizes = grouped[group].transform('size')
+        last = position == sizes - 1
+        largest = int(sizes.max()) if len(frame) else 0
+    stride = max(2, math.ceil(estimate_bytes(frame) / max_bytes))
+    while True:
+        reduced = frame[((position % stride == 0) | last).to_numpy()]
+        if estimate_bytes(reduced) <= max_bytes or len(reduced) <= 1:
+            return reduced
+        if stride >= largest:
+            # First and last rows of every group only, and still too big
+            return drop_groups(reduced, max_bytes, group)
+        stride = min(stride * 2, largest)
+
+
+def drop_groups(frame, max_bytes, group=None):
+    """The leading groups of ``frame`` (rows without ``group``) that fit ``max_bytes``, at least one."""
+    sizes = None if group is None else frame.groupby(group, sort=False).size()
+    keys = None if group is None else frame.set_index(group).index
+    max_rows = len(frame)
+    while True:
+        if group is None:
+            reduced = frame.iloc[:max_rows]
+        else:
+            kept = sizes.index[(sizes.cumsum() <= max_rows).to_numpy()]
+            if not len(kept):
+                kept = sizes.index[:1]
+            reduced = frame[keys.isin(kept)]
+        size = estimate_bytes(reduced)
+        if size <= max_bytes or len(reduced) <= 1 or max_rows <= 1:
+            break
+        # Rows shrink every round, so this ends
+        max_rows = max(min(int(max_rows * max_bytes / size), max_rows - 1), 1)
+    if group is not None:
+        logger.warning('%d of %d groups dropped to fit %d bytes', len(sizes) - len(kept), len(sizes), max_bytes)
+    return reduced
+
+
+def _groups(frame, group):
+    return frame.set_index(group).index.unique()
+
+
+def _names(keys, shown=10):
+    names = [' / '.join(map(str, key)) if isinstance(key, tuple) else str(key) for key in keys]
+    if len(names) > shown:
+        names = names[:shown] + ['%d more' % (len(names) - shown)]
+    return ', '.join(names)
+
+
+def guard(name, frame, reductions=(), group=None, max_bytes=None, sample=True, notices=None):
+    """Return ``frame``, or the first reduced variant of it whose payload fits ``max_bytes``.
+
+    ``reductions`` is a sequence of ``(label, function)`` or ``(label, function,
+    notice)`` pairs applied in turn, each to the result of the previous one; a
+    ``notice`` tells the user how the view differs. If none of them fits, the
+    result is downsampled per ``group`` (only when ``sample``), dropping whole
+    groups if need be, until it does. The notices of the variant used, and
+    the groups dropped, are appended to the list ``notices``.
+    """
+    if max_bytes is None:
+        max_bytes = PAYLOAD_MAX_BYTES
+    size = estimate_bytes(frame)
+    if size <= max_bytes:
+        return frame
+
+    original_size = size
+    shown = []
+    for reduction in reductions:
+        label, reduce = reduction[:2]
+        frame = reduce(frame)
+        size = estimate_bytes(frame)
+        shown.extend(reduction[2:])
+        if size <= max_bytes:
+            logger.warning('%s: payload of ~%d bytes is over %d, using %s (~%d bytes)',
+                           name, original_size, max_bytes, label, size)
+            if notices is not None:
+                notices.extend(shown)
+            return frame
+
+    if sample:
+        reduced = downsample(frame, max_bytes, group)
+        variant = 'a downsampled variant'
+        shown.append('%s: too much data to draw in full, only part of the points of each series are drawn.' % name)
+    else:
+        reduced = drop_groups(frame, max_bytes, group)
+        variant = 'fewer groups'
+        if group is None:
+            shown.append('%s: too much data to draw in full, only its first %d rows are drawn.' % (name, len(reduced)))
+    logger.warning('%s: payload of ~%d bytes is over %d, using %s (~%d bytes)',
+                   name, original_size, max_bytes, variant, estimate_bytes(reduced))
+    if group is not None:
+        dropped = _groups(frame, group).difference(_groups(reduced, group))
+        if len(dropped):
+            shown.append('%s: too much data to draw in full, not shown: %s.' % (name, _names(dropped)))
+    if notices is not None:
+        notices.extend(shown)
+    return reduced
@@ -0,0 +1,69 @@
+"""Progressive rendering of the dashboard sections.
+
+Each section of main.py draws its text and an empty placeholder right away
+and hands the slow part, querying its rows and building its chart, to
+``Sections.submit``, which runs it in a thread pool shared by every rerun.
+``Sections.run`` then fills the placeholders on the script thread as the
+charts get ready, in whatever order they finish: the first chart shows after
+the fastest section instead of after all of them.
+
+Streamlit elements can only be created from the script thread, so the
+submitted functions only compute and their ``then`` callbacks draw. A
+callback may submit more work, e.g. a section whose widgets need its data
+before its chart can be queried. ``InlineExecutor`` runs the sections one
+after the other instead, e.g. to account the memory of each.
+"""
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+SECTION_WORKERS = int(os.environ.get('TOBACCO_SECTION_WORKERS', 4))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool():
+    """The process-wide pool preparing the sections."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=SECTION_WORKERS, thread_name_prefix='section')
+    return _pool
+
+
+class InlineExecutor:
+    """Executor running each function right away on the thread submitting it."""
+
+    def submit(self, function, *args):
+        future = Future()
+        try:
+            future.set_result(function(*args))
+        except BaseException as error:
+            future.set_exception(error)
+        return future
+
+
+class Sections:
+    """Background work of one rerun and the callbacks drawing its results."""
+
+    def __init__(self, executor=None):
+        self._executor = executor or pool()
+        self._pending = {}
+
+    def submit(self, function, *args, then):
+        """Run ``function(*args)`` in the pool; ``run`` passes its result to ``then``."""
+        future = self._executor.submit(function, *args)
+        self._pending[future] = then
+        return future
+
+    def run(self):
+        """Call the callbacks on this thread as their work completes, until nothing is pending.
+
+        An exception of the work is raised here, like an error of the script.
+        """
+        while self._pending:
+            done, _ = wait(self._pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                self._pending.pop(future)(future.result())
@@ -0,0 +1,390 @@
+"""Read-only HTTP/JSON query API over the dashboard datasets.
+
+Serves the numbers shown by main.py to other tools, through the same
+repository as the dashboard (pandas frames or the SQLite store, see
+TOBACCO_BACKEND). Responses carry an ETag (``If-None-Match`` gets a
+304) and are kept in an in-process LRU cache keyed by path and query string.
+Data can change under a running server (refresh.py), so clients must
+revalidate: responses are ``no-cache``, and a conditional request costs a
+cache lookup.
+
+Endpoints (all GET, years are inclusive):
+    /countries?dataset=deaths|factors|sales|policy
+    /deaths/by-age?country=France&from=1990&to=2017
+    /risk-factors?country=France&from=1990&to=2017
+    /sales?country=France&country=Spain&from=1980&to=2000
+    /policy?year=2016&metric=Monitor&country=France
+
+The dashboard starts it in-process, sharing its repository, when
+TOBACCO_QUERY_API_PORT is set; it can also run on its own.
+
+Usage:
+    python query_api.py serve --port 8502
+    python query_api.py bench --requests 2000 --concurrency 8
+"""
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+import http.client
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import loaders
+import repository
+
+
+class QueryError(ValueError):
+    """Invalid query parameters, answered with a 400."""
+
+
+####### Queries
+
+def _records(frame):
+    return json.loads(frame.to_json(orient='records'))
+
+
+def _one(params, name, required=True):
+    values = params.get(name)
+    if not values:
+        if required:
+            raise QueryError('missing parameter: %s' % name)
+        return None
+    return values[-1]
+
+
+def _year(params, name):
+    value = _one(params, name, required=False)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise QueryError('%s must be a year, got %r' % (name, value))
+
+
+def _in_period(years, start, end):
+    mask = years.notna()
+    if start is not None:
+        mask &= years >= start
+    if end is not None:
+        mask &= years <= end
+    return mask
+
+
+def countries(params):
+    dataset = _one(params, 'dataset', required=False) or 'deaths'
+    if dataset not in DATASET_TABLES:
+        raise QueryError('unknown dataset: %s' % dataset)
+    return repository.get_repository().countries(dataset)
+
+
+def deaths_by_age(params):
+    deaths = repository.get_repository().deaths(_one(params, 'country'))
+    rows = deaths[_in_period(deaths['year'], _year(params, 'from'), _year(params, 'to'))]
+    return _records(rows.loc[:, ['year'] + loaders.AGE_GROUPS])
+
+
+def risk_factor_totals(params):
+    factors = repository.get_repository().risk_factors(_one(params, 'country'))
+    rows = factors[_in_period(factors['year'], _year(params, 'from'), _year(params, 'to'))]
+    totals = rows.loc[:, loaders.RISK_FACTORS].sum().sort_values(ascending=False)
+    return [{'Risk Factor': factor, 'deaths': float(total)} for factor, total in totals.items()]
+
+
+def sales_series(params):
+    selected = params.get('country')
+    if not selected:
+        raise QueryError('missing parameter: country')
+    sales = repository.get_repository().sales(selected)
+    rows = sales[_in_period(sales['Year'], _year(params, 'from'), _year(params, 'to'))]
+    return _records(rows.loc[:, ['Country', 'Year', 'NumCig']])
+
+
+def policy_scores(params):
+    metric = _one(params, 'metric', required=False)
+    if metric is not None and metric not in loaders.CONTROL_METRICS:
+        raise QueryError('unknown metric: %s' % metric)
+    policy = repository.get_repository().control_policy(_year(params, 'year'), metric)
+    country = _one(params, 'country', required=False)
+    if country is not None:
+        policy = policy[policy['Country'] == country]
+    return _records(policy.loc[:, ['Country', 'Year'] + ([metric] if metric else loaders.CONTROL_METRICS)])
+
+
+ENDPOINTS = {
+    '/countries': countries,
+    '/deaths/by-age': deaths_by_age,
+    '/risk-factors': risk_factor_totals,
+    '/sales': sales_series,
+    '/policy': policy_scores,
+}
+
+
+####### Response cache
+
+class ResponseCache:
+    """Thread-safe LRU of (ETag, body) pairs.
+
+    ``generation`` counts the data changes: a response computed before one
+    (maybe from the old data) is not stored after it.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        self.generation = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry, generation=None):
+        """Store ``entry`` unless the data changed since ``generation``; returns whether it did."""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return False
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return True
+
+    def new_generation(self):
+        """Mark a data change; returns the new generation."""
+        with self._lock:
+            self.generation += 1
+            return self.generation
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+
+response_cache = ResponseCache()
+
+
+def _compute(path, query):
+    endpoint = ENDPOINTS.get(path)
+    if endpoint is None:
+        return 404, None, json.dumps({'error': 'unknown endpoint: %s' % path}).encode()
+    try:
+        result = endpoint(parse_qs(query))
+    except QueryError as error:
+        return 400, None, json.dumps({'error': str(error)}).encode()
+    body = json.dumps(result).encode()
+    return 200, '"%s"' % hashlib.sha1(body).hexdigest(), body
+
+
+def respond(path, query):
+    """Status, ETag and JSON body for a request, served from the cache when possible."""
+    key = (path, query)
+    entry = response_cache.get(key)
+    if entry is not None:
+        return entry
+    generation = response_cache.generation
+    entry = _compute(path, query)
+    if entry[0] == 200:
+        response_cache.put(key, entry, generation)
+    return entry
+
+
+# dataset of each endpoint (as named by /countries) -> table refreshed by refresh.py
+DATASET_TABLES = {'deaths': 'deaths_by_age', 'factors': 'risk_factors',
+                  'sales': 'sales', 'policy': 'control_policy'}
+ENDPOINT_DATASETS = {'/deaths/by-age': 'deaths', '/risk-factors': 'factors',
+                     '/sales': 'sales', '/policy': 'policy'}
+
+
+def _affected(path, params, table, countries, years, keys_changed):
+    if path == '/countries':
+        dataset = params.get('dataset', ['deaths'])[-1]
+        return DATASET_TABLES.get(dataset) == table and keys_changed
+    if DATASET_TABLES.get(ENDPOINT_DATASETS.get(path)) != table:
+        return False
+    if 'country' in params:
+        return bool(set(params['country']) & countries)
+    if 'year' in params:
+        return any(value.isdigit() and int(value) in years for value in params['year'])
+    return True
+
+
+def invalidate(table, countries, years, keys_changed=True):
+    """Recompute the cached responses that read rows of ``countries``/``years`` of ``table``.
+
+    Entries are replaced, not dropped, so their next request is still a hit.
+    """
+    countries, years = set(countries), set(years)
+    # Requests computing now may have read the old data: they will not store it
+    response_cache.new_generation()
+    refreshed = 0
+    for path, query in response_cache.keys():
+        if _affected(path, parse_qs(query), table, countries, years, keys_changed):
+            entry = _compute(path, query)
+            if entry[0] == 200:
+                response_cache.put((path, query), entry)
+            refreshed += 1
+    return refreshed
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes, don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+    verbose = False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        status, etag, body = respond(url.path.rstrip('/') or '/', url.query)
+        if etag is not None and etag in self.headers.get('If-None-Match', ''):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if etag is not None:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(host='127.0.0.1', port=8502):
+    return ThreadingHTTPServer((host, port), QueryHandler)
+
+
+_background_server = None
+_background_lock = threading.Lock()
+
+
+def start_in_background(host='127.0.0.1', port=8502):
+    """Serve from a daemon thread of the current process (once), sharing its caches."""
+    global _background_server
+    with _background_lock:
+        if _background_server is None:
+            _background_server = make_server(host, port)
+            threading.Thread(target=_background_server.serve_forever, daemon=True).start()
+    return _background_server
+
+
+####### Benchmark
+
+BENCH_PATHS = ['/deaths/by-age?country=France&from=1990&to=2017',
+               '/risk-factors?country=Germany&from=2000&to=2010',
+               '/sales?country=France&country=Germany&country=Spain&from=1980&to=2000',
+               '/policy?year=2016&metric=Monitor',
+               '/countries?dataset=sales']
+
+
+def _client(host, port, paths, count, conditional, latencies):
+    connection = http.client.HTTPConnection(host, port)
+    etags = {}
+    for i in range(count):
+        path = paths[i % len(paths)]
+        headers = {'If-None-Match': etags[path]} if conditional and path in etags else {}
+        start = time.perf_counter()
+        connection.request('GET', path, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        etags[path] = response.getheader('ETag')
+    connection.close()
+
+
+def run_bench(requests=2000, concurrency=8, paths=BENCH_PATHS):
+    """Requests per second and latency percentiles against a local server."""
+    server = make_server(port=0)
+    host, port = server.server_address
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    results = {}
+    try:
+        for name, cached, conditional in [('uncached', False, False),
+                                          ('cached', True, False),
+                                          ('conditional', True, True)]:
+            response_cache.clear()
+            response_cache.maxsize = 1024 if cached else 0
+            latencies = []
+            per_client = max(requests // concurrency, 1)
+            clients = [threading.Thread(target=_client,
+                                        args=(host, port, paths, per_client, conditional, latencies))
+                       for _ in range(concurrency)]
+            start = time.perf_counter()
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+            elapsed = time.perf_counter() - start
+            latencies.sort()
+            results[name] = {'requests': len(latencies),
+                             'requests_per_second': len(latencies) / elapsed,
+                             'p50_ms': 1000 * latencies[len(latencies) // 2],
+                             'p95_ms': 1000 * latencies[int(len(latencies) * 0.95)]}
+    finally:
+        response_cache.maxsize = 1024
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Read-only query API over the tobacco datasets.')
+    subparsers = parser.add_subparsers(dest='command')
+    serve = subparsers.add_parser('serve')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8502)
+    serve.add_argument('--verbose', action='store_true')
+    bench = subparsers.add_parser('bench')
+    bench.add_argument('--requests', type=int, default=2000)
+    bench.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        QueryHandler.verbose = args.verbose
+        import refresh
+        refresh.start_watcher()
+        server = make_server(args.host, args.port)
+        print('Serving on http://%s:%d' % server.server_address)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+    if args.command == 'bench':
+        # Load every table once so the first scenario does not pay for it
+        for path in BENCH_PATHS:
+            _compute(*path.split('?'))
+        for name, result in run_bench(args.requests, args.concurrency).items():
+            print('%-12s %6d requests  %8.1f req/s  p50 %6.2f ms  p95 %6.2f ms' % (
+                name, result['requests'], result['requests_per_second'],
+                result['p50_ms'], result['p95_ms']))
+        return 0
+    parser.print_help()
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""Incremental refresh of the datasets when a CSV in data/ is replaced.
+
+When OWID or WHO publish a new year, the updated CSV is dropped over the
+old one. Instead of rebuilding everything, ``refresh`` diffs the new file
+against the snapshot the process already holds (its cached frame, or the
+SQLite store) by (country, year) and applies only the changed rows:
+
+* to the SQLite store, in one transaction, logged in ``refresh_log`` so that
+  other workers sharing the store skip the write but learn what changed;
+* to the cached frame of loaders.py, swapped for the new one in one step;
+* to the deaths-by-age stack and the per-country stacks of age_stacks.py,
+  recomputed for the changed countries only;
+* to the sales / deaths lag correlations of lag_correlation.py, recomputed
+  (one batched pass over every country);
+* to the sales trends of sales_trends.py, recomputed the same way;
+* to the client-side payloads of client_side.py, their sizes and specs, rebuilt;
+* to the query API responses that read the changed countries or years.
+
+Every cached value is replaced by its updated version rather than dropped,
+so readers never see a cold cache. ``start_watcher`` polls the files from a
+daemon thread, which is how running workers pick changes up without a
+restart. The control-policy specs of control_views.py read their data by
+URL in the browser and are not affected.
+
+Usage:
+    python refresh.py [deaths_by_age|risk_factors|sales|control_policy|control_deaths ...]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import sqlite3
+import argparse
+import threading
+
+import startup
+import loaders
+import datasets
+import sql_store
+import age_stacks
+import query_api
+import lag_correlation
+import sales_trends
+import client_side
+
+pd = startup.lazy_import('pandas')
+
+
+REFRESH_INTERVAL = float(os.environ.get('TOBACCO_REFRESH_INTERVAL', 5))
+
+# table -> (loader, source file)
+DATASETS = {name: (loaders.LOADERS[name], dataset.path) for name, dataset in datasets.DATASETS.items()}
+
+logger = logging.getLogger(__name__)
+
+
+def key_columns(table):
+    return datasets.DATASETS[table].keys
+
+
+class Diff:
+    """Rows of a new table version against the old one, by key."""
+
+    def __init__(self, keys, upserts, deletes, columns_changed=False, logged=None):
+        self.keys = keys
+        self.upserts = upserts  # added and changed rows, all columns
+        self.deletes = deletes  # keys of the removed and changed rows
+        self.columns_changed = columns_changed
+        self.logged = logged  # (countries, years) read from the store's refresh_log
+
+    @property
+    def empty(self):
+        return not self.columns_changed and self.upserts.empty and self.deletes.empty
+
+    @property
+    def countries(self):
+        if self.logged is not None:
+            return self.logged[0]
+        return set(self.upserts[self.keys[0]]) | set(self.deletes[self.keys[0]])
+
+    @property
+    def years(self):
+        if self.logged is not None:
+            return self.logged[1]
+        return {int(year) for year in set(self.upserts[self.keys[1]]) | set(self.deletes[self.keys[1]])}
+
+    @property
+    def keys_changed(self):
+        # Rows added or removed, not only updated in place
+        return len(self.upserts) != len(self.deletes) or self.columns_changed
+
+    def __repr__(self):
+        return '<Diff %d upserts, %d deletes, %d countries>' % (
+            len(self.upserts), len(self.deletes), len(self.countries))
+
+
+def diff(old, new, keys):
+    """``Diff`` turning ``old`` into ``new``; rows are compared column by column, NaN equal to NaN."""
+    if list(old.columns) != list(new.columns):
+        return Diff(keys, new, old.loc[:, keys], columns_changed=True)
+    old_rows = old.set_index(keys)
+    new_rows = new.set_index(keys)
+    common = old_rows.index.intersection(new_rows.index)
+    before = old_rows.loc[common].to_numpy()
+    after = new_rows.loc[common].to_numpy()
+    same = (before == after) | (pd.isna(before) & pd.isna(after))
+    changed = common[~same.all(axis=1)]
+    added = new_rows.index.difference(old_rows.index)
+    removed = old_rows.index.difference(new_rows.index)
+    upserts = new_rows.loc[changed.append(added)].reset_index()
+    deletes = changed.append(removed).to_frame(index=False)
+    return Diff(keys, upserts, deletes)
+
+
+####### Store
+
+def _logged_change(connection, table, version):
+    try:
+        row = connection.execute('SELECT countries, years FROM refresh_log WHERE "table" = ? AND signature = ?',
+                                 (table, version)).fetchone()
+    except sqlite3.OperationalError:
+        # A store built before refresh_log existed
+        return None
+    return None if row is None else (set(json.loads(row[0])), set(json.loads(row[1])))
+
+
+def apply_to_store(table, changes, version, path=None):
+    """Write ``changes`` to the store once; returns False if another worker already did."""
+    connection = sql_store.connect_writable(path or sql_store.SQL_PATH)
+    try:
+        connection.execute(sql_store.REFRESH_LOG_TABLE)
+        connection.execute(sql_store.SOURCES_TABLE)
+        connection.execute('BEGIN IMMEDIATE')
+        if _logged_change(connection, table, version) is not None:
+            connection.execute('ROLLBACK')
+            return False
+        where = ' AND '.join('%s = ?' % sql_store.quote(column) for column in changes.keys)
+        connection.executemany('DELETE FROM %s WHERE %s' % (table, where),
+                               zip(*(changes.deletes[column].tolist() for column in changes.keys)))
+        # Not DataFrame.to_sql, which commits on its own
+        upserts = changes.upserts.loc[:, datasets.DATASETS[table].view('store')]
+        upserts = upserts.astype(object).where(upserts.notna(), None)
+        connection.executemany('INSERT INTO %s (%s) VALUES (%s)' % (
+            table, ', '.join(sql_store.quote(column) for column in upserts.columns),
+            ', '.join('?' * len(upserts.columns))), upserts.itertuples(index=False, name=None))
+        connection.execute('INSERT INTO refresh_log VALUES (?, ?, ?, ?)',
+                           (table, version, json.dumps(sorted(changes.countries)),
+                            json.dumps(sorted(changes.years))))
+        # In the same transaction: the store is never marked current without the rows
+        connection.execute(sql_store.RECORD_SOURCE, (table, version))
+        connection.execute('COMMIT')
+        return True
+    except Exception:
+        if connection.in_transaction:
+            connection.execute('ROLLBACK')
+        raise
+    finally:
+        connection.close()
+
+
+def _store_snapshot(table, path):
+    return pd.read_sql_query('SELECT * FROM %s' % table, sql_store.connect(path))
+
+
+####### Refresh
+
+_refresh_lock = threading.Lock()
+_versions = {}
+
+
+def refresh(table, store_path=None):
+    """Apply the changes of ``table``'s source file to every cache of this process and the store.
+
+    Returns the ``Diff`` applied (None when nothing was loaded or stored yet).
+    """
+    load, source = DATASETS[table]
+    store_path = store_path or sql_store.SQL_PATH
+    with _refresh_lock:
+        version = sql_store.signature(source)
+        if _versions.get(table) == version:
+            return None
+        keys = key_columns(table)
+        has_store = os.path.exists(store_path)
+        start = time.perf_counter()
+
+        dataset = datasets.DATASETS[table]
+        # The store keeps columns no in-memory view reads (codes, IDs): parse them for its rows
+        new = datasets.read(dataset, dataset.view('store')) if has_store else load.parse()
+        frame = new.loc[:, dataset.used_columns]
+        if load.is_loaded():
+            changes = diff(load(), frame, keys)
+            if has_store and not changes.columns_changed:
+                # The changed rows as the store has them (a change of a store-only column alone
+                # goes unseen until the next change of the row)
+                changes.upserts = new.set_index(keys).loc[
+                    pd.MultiIndex.from_frame(changes.upserts.loc[:, keys])].reset_index()
+        elif has_store:
+            logged = _logged_change(sql_store.connect(store_path), table, version)
+            if logged is not None:
+                # Another worker applied this version, only the caches of this process are left
+                changes = Diff(keys, new[new[keys[0]].isin(logged[0])], new.iloc[:0][keys], logged=logged)
+            else:
+                changes = diff(_store_snapshot(table, store_path), new, keys)
+        else:
+            _versions[table] = version
+            return None
+
+        if changes.columns_changed:
+            # A new file layout: nothing to diff against, start over from the new file
+            load.install(frame)
+            if has_store:
+                sql_store.build(store_path)
+            age_stacks.clear_caches()
+            lag_correlation.clear_caches()
+            sales_trends.clear_caches()
+            client_side.clear_caches()
+            query_api.response_cache.clear()
+        elif not changes.empty:
+            if has_store:
+                apply_to_store(table, changes, version, store_path)
+            if load.is_loaded():
+                load.install(frame)
+            if table == 'deaths_by_age':
+                age_stacks.update_countries(frame, changes.countries)
+            if table in ('deaths_by_age', 'sales'):
+                lag_correlation.update()
+            if table == 'sales':
+                sales_trends.update()
+            if table in ('deaths_by_age', 'risk_factors', 'sales'):
+                client_side.update()
+            query_api.invalidate(table, changes.countries, changes.years, changes.keys_changed)
+        elif has_store:
+            # Same rows in a newer file: the store is current, not stale
+            sql_store.record_source(table, version, store_path)
+        _versions[table] = version
+        logger.warning('%s: refreshed %r in %.3f s', table, changes, time.perf_counter() - start)
+        return changes
+
+
+def refresh_all(store_path=None):
+    return {table: refresh(table, store_path) for table in DATASETS}
+
+
+def _watch(interval, store_path):
+    while True:
+        time.sleep(interval)
+        for table, (_, source) in DATASETS.items():
+            try:
+                if os.path.exists(source) and _versions.get(table) != sql_store.signature(source):
+                    refresh(table, store_path)
+            except Exception:
+                logger.exception('%s: refresh failed', table)
+
+
+_watcher = None
+
+
+def start_watcher(interval=REFRESH_INTERVAL, store_path=None):
+    """Poll the source files every ``interval`` seconds from a daemon thread (once per process)."""
+    global _watcher
+    with _refresh_lock:
+        if _watcher is None and interval > 0:
+            # The files as they are now are what this process loads
+            for table, (_, source) in DATASETS.items():
+                if os.path.exists(source):
+                    _versions.setdefault(table, sql_store.signature(source))
+            _watcher = threading.Thread(target=_watch, args=(interval, store_path), daemon=True)
+            _watcher.start()
+    return _watcher
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Apply updated CSVs in data/ to the SQLite store.')
+    parser.add_argument('tables', nargs='*', metavar='table', help='default: every table')
+    parser.add_argument('--store', default=sql_store.SQL_PATH)
+    args = parser.parse_args(argv)
+    unknown = set(args.tables) - set(DATASETS)
+    if unknown:
+        parser.error('unknown tables: %s (expected %s)' % (', '.join(sorted(unknown)), ', '.join(DATASETS)))
+
+    for table in args.tables or list(DATASETS):
+        changes = refresh(table, args.store)
+        print('%-15s %s' % (table, 'no store or snapshot' if changes is None else changes))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
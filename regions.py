@@ -0,0 +1,173 @@
+"""WHO-region partitions of the world-countries.json topology.
+
+The control-policy map used to ship and project every country polygon even
+when the analyst looks at a single WHO region. ``region_topology`` cuts the
+topology down to the features (and the arcs they reference) of one region,
+``world_outline`` keeps every feature but only a fraction of the arc points,
+and ``region_projection`` fits a Mercator projection to the region. All of
+them are cached, so switching region does not rebuild anything.
+"""
+import json
+import math
+from functools import lru_cache
+
+
+TOPOLOGY_PATH = 'world-countries.json'
+TOPOLOGY_OBJECT = 'countries1'
+
+# WHO regions by the country names used in the topology
+WHO_REGIONS = {
+    'Africa': [
+        'Algeria', 'Angola', 'Benin', 'Botswana', 'Burkina Faso', 'Burundi',
+        'Cameroon', 'Central African Republic', 'Chad', 'Democratic Republic of the Congo',
+        'Equatorial Guinea', 'Eritrea', 'Ethiopia', 'Gabon', 'Gambia', 'Ghana', 'Guinea',
+        'Guinea Bissau', 'Ivory Coast', 'Kenya', 'Lesotho', 'Liberia', 'Madagascar',
+        'Malawi', 'Mali', 'Mauritania', 'Mozambique', 'Namibia', 'Niger', 'Nigeria',
+        'Republic of the Congo', 'Rwanda', 'Senegal', 'Sierra Leone', 'South Africa',
+        'South Sudan', 'Swaziland', 'Togo', 'Uganda', 'United Republic of Tanzania',
+        'Zambia', 'Zimbabwe'],
+    'Americas': [
+        'Argentina', 'Belize', 'Bermuda', 'Bolivia', 'Brazil', 'Canada', 'Chile',
+        'Colombia', 'Costa Rica', 'Cuba', 'Dominican Republic', 'Ecuador', 'El Salvador',
+        'Falkland Islands', 'French Guiana', 'Guatemala', 'Guyana', 'Haiti', 'Honduras',
+        'Jamaica', 'Mexico', 'Nicaragua', 'Panama', 'Paraguay', 'Peru', 'Puerto Rico',
+        'Suriname', 'The Bahamas', 'Trinidad and Tobago', 'United States of America',
+        'Uruguay', 'Venezuela'],
+    'South-East Asia': [
+        'Bangladesh', 'Bhutan', 'East Timor', 'India', 'Indonesia', 'Myanmar', 'Nepal',
+        'North Korea', 'Sri Lanka', 'Thailand'],
+    'Europe': [
+        'Albania', 'Armenia', 'Austria', 'Azerbaijan', 'Belarus', 'Belgium',
+        'Bosnia and Herzegovina', 'Bulgaria', 'Croatia', 'Cyprus', 'Czech Republic',
+        'Denmark', 'Estonia', 'Finland', 'France', 'Georgia', 'Germany', 'Greece',
+        'Greenland', 'Hungary', 'Iceland', 'Ireland', 'Israel', 'Italy', 'Kazakhstan',
+        'Kosovo', 'Kyrgyzstan', 'Latvia', 'Lithuania', 'Luxembourg', 'Macedonia', 'Malta',
+        'Moldova', 'Montenegro', 'Netherlands', 'Northern Cyprus', 'Norway', 'Poland',
+        'Portugal', 'Republic of Serbia', 'Romania', 'Russia', 'Slovakia', 'Slovenia',
+        'Spain', 'Sweden', 'Switzerland', 'Tajikistan', 'Turkey', 'Turkmenistan',
+        'Ukraine', 'United Kingdom', 'Uzbekistan'],
+    'Eastern Mediterranean': [
+        'Afghanistan', 'Djibouti', 'Egypt', 'Iran', 'Iraq', 'Jordan', 'Kuwait', 'Lebanon',
+        'Libya', 'Morocco', 'Oman', 'Pakistan', 'Qatar', 'Saudi Arabia', 'Somalia',
+        'Somaliland', 'Sudan', 'Syria', 'Tunisia', 'United Arab Emirates', 'West Bank',
+        'Western Sahara', 'Yemen'],
+    'Western Pacific': [
+        'Australia', 'Brunei', 'Cambodia', 'China', 'Fiji', 'Japan', 'Laos', 'Malaysia',
+        'Mongolia', 'New Caledonia', 'New Zealand', 'Papua New Guinea', 'Philippines',
+        'Solomon Islands', 'South Korea', 'Taiwan', 'Vanuatu', 'Vietnam'],
+}
+
+
+@lru_cache(maxsize=None)
+def load_topology(path=TOPOLOGY_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _arc_ids(geometry):
+    # Polygon arcs are a list of rings, MultiPolygon arcs a list of polygons;
+    # a negative index ~i refers to arc i reversed
+    rings = geometry['arcs'] if geometry['type'] == 'Polygon' else \
+        [ring for polygon in geometry['arcs'] for ring in polygon]
+    return [index if index >= 0 else ~index for ring in rings for index in ring]
+
+
+def _reindex(arcs, mapping):
+    if isinstance(arcs, int):
+        return mapping[arcs] if arcs >= 0 else ~mapping[~arcs]
+    return [_reindex(item, mapping) for item in arcs]
+
+
+def _subset(topology, geometries):
+    used = sorted({index for geometry in geometries for index in _arc_ids(geometry)})
+    mapping = {old: new for new, old in enumerate(used)}
+    return {
+        'type': 'Topology',
+        'transform': topology['transform'],
+        'arcs': [topology['arcs'][index] for index in used],
+        'objects': {TOPOLOGY_OBJECT: {
+            'type': 'GeometryCollection',
+            'geometries': [dict(geometry, arcs=_reindex(geometry['arcs'], mapping))
+                           for geometry in geometries]}},
+    }
+
+
+@lru_cache(maxsize=None)
+def region_topology(region, path=TOPOLOGY_PATH):
+    """Topology with only the features of ``region`` and the arcs they use."""
+    countries = set(WHO_REGIONS[region])
+    topology = load_topology(path)
+    geometries = [geometry for geometry in topology['objects'][TOPOLOGY_OBJECT]['geometries']
+                  if geometry['properties']['name'] in countries]
+    return _subset(topology, geometries)
+
+
+def _decode(arc):
+    # Arcs are delta-encoded quantized positions
+    x = y = 0
+    points = []
+    for dx, dy in arc:
+        x += dx
+        y += dy
+        points.append((x, y))
+    return points
+
+
+def _encode(points):
+    previous = (0, 0)
+    arc = []
+    for point in points:
+        arc.append([point[0] - previous[0], point[1] - previous[1]])
+        previous = point
+    return arc
+
+
+@lru_cache(maxsize=None)
+def world_outline(step=8, path=TOPOLOGY_PATH):
+    """Every feature with only one in ``step`` arc points kept (endpoints always kept)."""
+    topology = load_topology(path)
+    arcs = []
+    for arc in topology['arcs']:
+        points = _decode(arc)
+        arcs.append(_encode(points[:-1:step] + points[-1:]))
+    simplified = dict(topology, arcs=arcs)
+    return _subset(simplified, topology['objects'][TOPOLOGY_OBJECT]['geometries'])
+
+
+def _positions(topology):
+    scale, translate = topology['transform']['scale'], topology['transform']['translate']
+    for arc in topology['arcs']:
+        for x, y in _decode(arc):
+            yield x * scale[0] + translate[0], y * scale[1] + translate[1]
+
+
+def _mercator_y(latitude):
+    latitude = max(min(latitude, 85.0), -85.0)
+    return math.log(math.tan(math.pi / 4 + math.radians(latitude) / 2))
+
+
+@lru_cache(maxsize=None)
+def region_projection(region, width, height, padding=0.05, path=TOPOLOGY_PATH):
+    """Mercator ``rotate``/``center``/``scale``/``translate`` fitting ``region`` in width x height."""
+    positions = list(_positions(region_topology(region, path)))
+    longitudes = sorted(longitude for longitude, _ in positions)
+    latitudes = [latitude for _, latitude in positions]
+
+    # The region's longitude span is the circle minus its largest empty gap,
+    # so regions crossing the antimeridian (Europe with Chukotka, Fiji) stay compact
+    gaps = [(longitudes[i + 1] - longitudes[i], i) for i in range(len(longitudes) - 1)]
+    gaps.append((longitudes[0] + 360 - longitudes[-1], len(longitudes) - 1))
+    _, i = max(gaps)
+    west = longitudes[(i + 1) % len(longitudes)]
+    east = longitudes[i] if longitudes[i] >= west else longitudes[i] + 360
+    center_longitude = (west + east) / 2
+
+    y_min, y_max = _mercator_y(min(latitudes)), _mercator_y(max(latitudes))
+    center_latitude = math.degrees(2 * math.atan(math.exp((y_min + y_max) / 2)) - math.pi / 2)
+    scale = (1 - padding) * min(width / math.radians(max(east - west, 1e-6)),
+                                height / max(y_max - y_min, 1e-6))
+    return {'type': 'mercator',
+            'rotate': [-center_longitude, 0, 0],
+            'center': [0, center_latitude],
+            'scale': scale,
+            'translate': [width / 2, height / 2]}
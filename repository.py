@@ -0,0 +1,332 @@
+"""Repository interface used by every section query of the dashboard.
+
+``PandasRepository`` answers from the cached in-memory frames of loaders.py;
+``SqlRepository`` from the embedded SQLite store of sql_store.py, so a worker
+only holds the rows of the views it draws. Both return the same frames.
+Pick the backend with ``TOBACCO_BACKEND=pandas|sqlite`` (pandas by default).
+
+Usage:
+    python repository.py bench [--scale 1 100] [--repeat 50]
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from functools import lru_cache
+
+import startup
+import loaders
+import datasets
+import age_stacks
+import sql_store
+import lag_correlation
+import sales_trends
+
+pd = startup.lazy_import('pandas')
+
+
+BACKEND = os.environ.get('TOBACCO_BACKEND', 'pandas')
+
+
+def _between(column, period):
+    return column.between(*period) if period is not None else column.notna()
+
+
+class PandasRepository:
+    """Queries over the in-memory frames of loaders.py."""
+
+    in_memory = True
+
+    def countries(self, dataset='deaths'):
+        load, column = {'deaths': (loaders.load_deaths, 'country'),
+                        'factors': (loaders.load_factors, 'country'),
+                        'sales': (loaders.load_sales, 'Country'),
+                        'policy': (loaders.load_control_policy, 'Country')}[dataset]
+        return sorted(load()[column].dropna().unique().tolist())
+
+    def deaths(self, country=None):
+        deaths = loaders.load_deaths()
+        return deaths if country is None else deaths[deaths['country'] == country]
+
+    def age_stack(self, country):
+        return age_stacks.country_stack(country)
+
+    def lag_correlations(self, change=False):
+        def compute():
+            return lag_correlation.correlate(loaders.load_sales(),
+                                             lag_correlation.death_totals(loaders.load_deaths()), change)
+        return lag_correlation.cached('pandas', change, compute)
+
+    def risk_factors(self, country=None):
+        factors = loaders.load_factors()
+        return factors if country is None else factors[factors['country'] == country]
+
+    def sales(self, countries=None, period=None):
+        sales = loaders.load_sales()
+        if countries is None and period is None:
+            return sales
+        mask = _between(sales['Year'], period)
+        if countries is not None:
+            mask &= sales['Country'].isin(countries)
+        return sales[mask.fillna(False).to_numpy(dtype=bool)]
+
+    def sales_trends(self, countries=None, period=None):
+        return sales_trends.select(sales_trends.cached('pandas', loaders.load_sales), countries, period)
+
+    def sales_years(self):
+        years = loaders.load_sales()['Year']
+        return int(years.min()), int(years.max())
+
+    def control_policy(self, year=None, metric=None):
+        policy = loaders.load_control_policy()
+        columns = ['ID', 'Country', 'Year'] + ([metric] if metric else loaders.CONTROL_METRICS)
+        rows = policy if year is None else policy[policy['Year'] == year]
+        return rows.loc[:, columns].sort_values(['Country', 'Year'], kind='mergesort')
+
+    def control_deaths(self, country=None):
+        policy = loaders.load_control_policy()
+        if country is not None:
+            policy = policy[policy['Country'] == country]
+        deaths = loaders.load_control_deaths().loc[:, ['ID', 'Code', 'deaths']]
+        return policy.merge(deaths, on='ID', how='left').sort_values(['Country', 'Year'], kind='mergesort')
+
+
+def _columns(dataset):
+    # The columns of the in-memory frames, so both backends return the same frames
+    return ', '.join(sql_store.quote(column) for column in dataset.used_columns)
+
+
+class SqlRepository:
+    """The same queries against the indexed SQLite store."""
+
+    in_memory = False
+
+    def __init__(self, path=None):
+        self.path = sql_store.ensure(path or sql_store.SQL_PATH)
+
+    def _query(self, sql, params=()):
+        return pd.read_sql_query(sql, sql_store.connect(self.path), params=params)
+
+    def _where(self, conditions):
+        clauses = [clause for clause, _ in conditions]
+        params = [param for _, values in conditions for param in values]
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def countries(self, dataset='deaths'):
+        table, column = {'deaths': ('deaths_by_age', 'country'),
+                         'factors': ('risk_factors', 'country'),
+                         'sales': ('sales', 'Country'),
+                         'policy': ('control_policy', 'Country')}[dataset]
+        rows = sql_store.connect(self.path).execute(
+            'SELECT DISTINCT "%s" FROM %s WHERE "%s" IS NOT NULL ORDER BY 1' % (column, table, column))
+        return [country for country, in rows]
+
+    def deaths(self, country=None):
+        where, params = self._where([('country = ?', [country])] if country is not None else [])
+        return self._query('SELECT %s FROM deaths_by_age' % _columns(datasets.DEATHS) + where + ' ORDER BY country, year', params)
+
+    def age_stack(self, country):
+        return _sql_age_stack(self.path, country)
+
+    def lag_correlations(self, change=False):
+        return _sql_lag_correlations(self.path, change)
+
+    def risk_factors(self, country=None):
+        where, params = self._where([('country = ?', [country])] if country is not None else [])
+        return self._query('SELECT %s FROM risk_factors' % _columns(datasets.FACTORS) + where + ' ORDER BY country, year', params)
+
+    def sales(self, countries=None, period=None):
+        conditions = []
+        if countries is not None:
+            conditions.append(('"Country" IN (%s)' % ','.join('?' * len(countries)), list(countries)))
+        if period is not None:
+            conditions.append(('"Year" BETWEEN ? AND ?', list(period)))
+        where, params = self._where(conditions)
+        sales = self._query('SELECT %s FROM sales' % _columns(datasets.SALES) + where + ' ORDER BY "Country", "Year"', params)
+        return sales.astype({'Year': 'int64', 'NumCig': 'float64'})
+
+    def sales_trends(self, countries=None, period=None):
+        # Computed once from the whole sales table: the rolling means of a period's
+        # first years read the years before it
+        return sales_trends.select(sales_trends.cached(('sqlite', self.path), self.sales), countries, period)
+
+    def sales_years(self):
+        # Two subqueries, so each bound is read off the year index
+        return sql_store.connect(self.path).execute(
+            'SELECT (SELECT MIN("Year") FROM sales), (SELECT MAX("Year") FROM sales)').fetchone()
+
+    def control_policy(self, year=None, metric=None):
+        metrics = [metric] if metric else loaders.CONTROL_METRICS
+        columns = ', '.join(sql_store.quote(column) for column in ['ID', 'Country', 'Year'] + metrics)
+        where, params = self._where([('"Year" = ?', [year])] if year is not None else [])
+        return self._query('SELECT %s FROM control_policy%s ORDER BY "Country", "Year"' % (columns, where),
+                           params)
+
+    def control_deaths(self, country=None):
+        where, params = self._where([('"Country" = ?', [country])] if country is not None else [])
+        return self._query('SELECT * FROM control_policy_deaths' + where + ' ORDER BY "Country", "Year"',
+                           params)
+
+
+def _sql_age_stack(path, country):
+    def compute():
+        deaths = pd.read_sql_query('SELECT * FROM deaths_by_age WHERE country = ?',
+                                   sql_store.connect(path), params=[country])
+        return age_stacks.stack_frames(age_stacks.stack_arrays(deaths))
+    return age_stacks.cached_stack(('sqlite', path), country, compute)
+
+
+def _sql_lag_correlations(path, change):
+    def compute():
+        connection = sql_store.connect(path)
+        sales = pd.read_sql_query('SELECT "Country", "Year", "NumCig" FROM sales', connection)
+        # Only the all-ages totals of the countries with sales leave the store
+        deaths = pd.read_sql_query(
+            'SELECT country, year, %s AS total FROM deaths_by_age WHERE country IN (SELECT "Country" FROM sales)'
+            % ' + '.join(sql_store.quote(age) for age in loaders.AGE_GROUPS), connection)
+        return lag_correlation.correlate(sales, deaths, change)
+    return lag_correlation.cached(('sqlite', path), change, compute)
+
+
+REPOSITORIES = {'pandas': PandasRepository, 'sqlite': SqlRepository}
+
+
+@lru_cache(maxsize=None)
+def get_repository(backend=BACKEND):
+    """The process-wide repository of ``backend``."""
+    if backend not in REPOSITORIES:
+        raise ValueError('unknown backend %r, expected one of %s' % (backend, ', '.join(REPOSITORIES)))
+    return REPOSITORIES[backend]()
+
+
+####### Benchmark
+
+# The queries main.py runs on a rerun
+BENCH_QUERIES = [
+    ('countries', lambda repo: repo.countries('deaths')),
+    ('age stack', lambda repo: repo.age_stack('France')),
+    ('risk factors', lambda repo: repo.risk_factors('France')),
+    ('sales', lambda repo: repo.sales(['France', 'Germany', 'Spain'], (1980, 2000))),
+    ('sales years', lambda repo: repo.sales_years()),
+    ('policy', lambda repo: repo.control_policy(2016, 'Monitor')),
+    ('control deaths', lambda repo: repo.control_deaths('France')),
+]
+
+_SUFFIXED_COLUMNS = ('Entity', 'Country', 'ID')
+
+
+def write_scaled_data(directory, scale):
+    """Copies of the CSVs in ``directory`` with ``scale`` times the countries.
+
+    Copy ``k`` of a country is named ``"<country> #k"``, so queries for the
+    original countries return the same rows at every scale.
+    """
+    for source in sql_store.SOURCES:
+        frame = pd.read_csv(source)
+        copies = [frame]
+        for k in range(1, scale):
+            copy = frame.copy()
+            for column in copy.columns:
+                if column in _SUFFIXED_COLUMNS:
+                    if column == 'ID':
+                        copy[column] = copy[column].str.replace(r'(\d+)$', r' #%d\1' % k, regex=True)
+                    else:
+                        copy[column] = copy[column] + ' #%d' % k
+            copies.append(copy)
+        pd.concat(copies, ignore_index=True).to_csv(
+            os.path.join(directory, os.path.basename(source)), index=False)
+
+
+def _rss_bytes():
+    # Resident set size of this process, Linux first, peak RSS elsewhere
+    try:
+        with open('/proc/self/status') as f:
+            match = re.search(r'VmRSS:\s+(\d+) kB', f.read())
+        return int(match.group(1)) * 1024
+    except (OSError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def bench_worker(backend, repeat):
+    """Latencies of BENCH_QUERIES and RSS of a fresh worker, run in a subprocess."""
+    pd.DataFrame  # import pandas before measuring the baseline
+    rss_start = _rss_bytes()
+    start = time.perf_counter()
+    # Builds the store first if it is missing or stale
+    repo = get_repository(backend)
+    results = {'backend': backend, 'open_ms': 1000 * (time.perf_counter() - start), 'queries': {}}
+    for name, query in BENCH_QUERIES:
+        start = time.perf_counter()
+        query(repo)
+        cold = time.perf_counter() - start
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            query(repo)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        results['queries'][name] = {'cold_ms': 1000 * cold, 'p50_ms': 1000 * latencies[len(latencies) // 2]}
+    results['rss_bytes'] = _rss_bytes()
+    results['rss_added_bytes'] = results['rss_bytes'] - rss_start
+    return results
+
+
+def run_bench(scales=(1, 100), repeat=50):
+    """``bench_worker`` results of both backends at every scale, each in a fresh process."""
+    results = []
+    for scale in scales:
+        directory = tempfile.mkdtemp(prefix='tobacco-x%d-' % scale)
+        try:
+            write_scaled_data(directory, scale)
+            env = dict(os.environ, TOBACCO_DATA_DIR=directory,
+                       TOBACCO_SQL_PATH=os.path.join(directory, 'tobacco.sqlite'))
+            # Both backends with the store built up front, then a SQLite worker
+            # starting without a store, which builds it itself
+            subprocess.run([sys.executable, sql_store.__file__], env=env, check=True,
+                           stdout=subprocess.DEVNULL)
+            runs = [(backend, 'prebuilt') for backend in REPOSITORIES] + [('sqlite', 'missing')]
+            for backend, store in runs:
+                if store == 'missing':
+                    os.remove(env['TOBACCO_SQL_PATH'])
+                output = subprocess.run([sys.executable, __file__, 'worker', backend, '--repeat', str(repeat)],
+                                        env=env, check=True, stdout=subprocess.PIPE).stdout
+                results.append(dict(json.loads(output), scale=scale, store=store))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the pandas and SQLite repositories.')
+    subparsers = parser.add_subparsers(dest='command')
+    bench = subparsers.add_parser('bench')
+    bench.add_argument('--scale', type=int, nargs='+', default=[1, 100])
+    bench.add_argument('--repeat', type=int, default=50)
+    worker = subparsers.add_parser('worker')
+    worker.add_argument('backend', choices=list(REPOSITORIES))
+    worker.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    if args.command == 'worker':
+        print(json.dumps(bench_worker(args.backend, args.repeat)))
+        return 0
+    if args.command == 'bench':
+        for result in run_bench(args.scale, args.repeat):
+            print('x%-4d %-7s store %-8s open %8.1f ms  RSS %7.1f MB (+%.1f MB)' % (
+                result['scale'], result['backend'], result['store'], result['open_ms'],
+                result['rss_bytes'] / 1e6, result['rss_added_bytes'] / 1e6))
+            for name, query in result['queries'].items():
+                print('      %-15s cold %8.2f ms  p50 %8.2f ms' % (name, query['cold_ms'], query['p50_ms']))
+        return 0
+    parser.print_help()
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""Precomputed trends of the sales series: rolling means, yearly change, peaks.
+
+The sales chart plots either each country's raw yearly ``NumCig`` or its
+smoothed trend. Both come from one table computed once per process for every
+country at once, in NumPy, from the sales sorted by country and year:
+
+* ``smoothed``: mean of the country's values over the ROLLING_YEARS years up
+  to and including the row's year (years missing from the file are skipped);
+* ``yoy``: change from the country's previous year, NaN if that year is missing;
+* ``peak``: True on the country's year of highest sales.
+
+The rows stay in (Country, Year) order with an index of each country's rows,
+like age_stacks.py, so a rerun only slices its countries and switching
+between raw and smoothed costs nothing.
+"""
+import os
+
+import startup
+
+np = startup.lazy_import('numpy')
+pd = startup.lazy_import('pandas')
+
+
+ROLLING_YEARS = int(os.environ.get('TOBACCO_ROLLING_YEARS', 5))
+
+TREND_COLUMNS = ['smoothed', 'yoy', 'peak']
+
+DECIMALS = 3
+
+# Mode of the sales chart -> column it draws
+MODES = {'Raw': 'NumCig', 'Smoothed': 'smoothed'}
+
+
+def trend_table(sales, window=ROLLING_YEARS):
+    """``Country``, ``Year``, ``NumCig`` and the TREND_COLUMNS of every row, sorted by country and year."""
+    sales = sales.loc[:, ['Country', 'Year', 'NumCig']].sort_values(
+        ['Country', 'Year'], kind='mergesort').reset_index(drop=True)
+    country = sales['Country'].to_numpy()
+    year = sales['Year'].to_numpy()
+    values = sales['NumCig'].to_numpy(dtype='float64')
+    rows = len(sales)
+    if not rows:
+        return sales.assign(smoothed=[], yoy=[], peak=np.array([], dtype=bool))
+
+    new_country = np.r_[True, country[1:] != country[:-1]]
+    codes = np.cumsum(new_country) - 1
+    starts = np.flatnonzero(new_country)
+    lengths = np.diff(np.r_[starts, rows])
+
+    # One sorted key per row, spaced so that a window never reaches the previous country:
+    # the first row of each window is then a binary search away
+    span = int(year.max() - year.min()) + window + 1
+    key = codes * span + (year - year.min())
+    first = np.searchsorted(key, key - (window - 1))
+    known = ~np.isnan(values)
+    sums = np.r_[0.0, np.cumsum(np.where(known, values, 0.0))]
+    counts = np.r_[0, np.cumsum(known)]
+    end = np.arange(1, rows + 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        smoothed = (sums[end] - sums[first]) / (counts[end] - counts[first])
+
+    follows = np.r_[False, (codes[1:] == codes[:-1]) & (year[1:] == year[:-1] + 1)]
+    yoy = np.r_[np.nan, np.diff(values)]
+    yoy[~follows] = np.nan
+
+    # First year reaching the country's maximum
+    filled = np.where(known, values, -np.inf)
+    highest = known & (filled == np.repeat(np.maximum.reduceat(filled, starts), lengths))
+    seen = np.cumsum(highest)
+    seen_before = np.repeat(np.r_[0, seen][starts], lengths)
+    peak = highest & (seen - seen_before == 1)
+
+    # The file has one or two decimals: drop the float noise, which would only bloat the chart payloads
+    return sales.assign(smoothed=smoothed.round(DECIMALS), yoy=yoy.round(DECIMALS), peak=peak)
+
+
+def _index_countries(table):
+    # country -> slice of its (contiguous, sorted) rows
+    country = table['Country'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, country[1:] != country[:-1]])
+    ends = np.r_[starts[1:], len(country)]
+    return {country[start]: slice(start, end) for start, end in zip(starts, ends)}
+
+
+def select(trends, countries=None, period=None):
+    """Rows of ``countries`` (all by default) within ``period`` of a ``cached`` trend table."""
+    table, index = trends
+    if countries is not None:
+        slices = [index[country] for country in countries if country in index]
+        rows = np.concatenate([np.arange(part.start, part.stop) for part in slices] or [np.arange(0)])
+        table = table.iloc[np.sort(rows)]
+    if period is not None:
+        table = table[table['Year'].between(*period).to_numpy()]
+    return table
+
+
+####### Cache
+
+# source -> (compute, (trend table, country index))
+_trends = {}
+
+
+def cached(source, compute):
+    """Trend table of ``compute()`` (a sales frame) and its country index, cached per ``source``."""
+    entry = _trends.get(source)
+    if entry is None:
+        entry = _trends.setdefault(source, (compute, _build(compute)))
+    return entry[1]
+
+
+def _build(compute):
+    table = trend_table(compute())
+    return table, _index_countries(table)
+
+
+def update():
+    """Rebuild every cached table from the current sales (refresh.py), replacing it in place."""
+    for source, (compute, _) in list(_trends.items()):
+        _trends[source] = (compute, _build(compute))
+
+
+def clear_caches():
+    _trends.clear()
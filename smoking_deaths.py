@@ -2,6 +2,8 @@ import altair as alt
 import streamlit as st
 import pandas as pd
 
+import loaders
+
 
 st.header("Smoking Deaths from 1990 to 2017")
 
@@ -11,94 +13,12 @@ to country policies against Tobacco. A score from 1 to 5 is assigned depending o
 of a country to deal with Tobacco issues being 1 the worst and 5 the best
 '''
 
-deaths = pd.read_csv('data/smoking-deaths-by-age.csv',
-                    header=0,
-                    names=[
-                        'country',
-                        'code',
-                        'year',
-                        '15 to 49',
-                        '50 to 69',
-                        'Above 70'])
-factors = pd.read_csv('data/number-of-deaths-by-risk-factor.csv',
-                    header=0,
-                    index_col=False,
-                    names=[
-                        'country',
-                        'code',
-                        'year',
-                        'Diet low in vegetables',
-                        'Diet low in whole grains',
-                        'Diet low in nuts and seeds',
-                        'Diet low in calcium',
-                        'Unsafe sex',
-                        'No access to handwashing facility',
-                        'Child wasting',
-                        'Child stunting',
-                        'Diet high in red meat',
-                        'Diet low in fiber',
-                        'Diet low in seafood omega-3 fatty acids',
-                        'Diet high in sodium',
-                        'Low physical activity',
-                        'Non-exclusive breastfeeding',
-                        'Discontinued breastfeeding',
-                        'Iron deficiency',
-                        'Vitamin A deficiency',
-                        'Zinc deficiency',
-                        'Smoking',
-                        'Secondhand smoke',
-                        'Alcohol use',
-                        'Drug use',
-                        'High fasting plasma glucose',
-                        'High total cholesterol', # Many null values
-                        'High systolic blood pressure',
-                        'High body-mass index',
-                        'Low bone mineral density',
-                        'Diet low in fruits',
-                        'Diet low in legumes',
-                        'Low birth weight for gestation',
-                        'Unsafe water source',
-                        'Unsafe sanitation',
-                        'Household air pollution from solid fuels',
-                        'Air pollution',
-                        'Outdoor air pollution'])
+deaths = loaders.load_deaths()
+factors = loaders.load_factors()
 
 # Convert data from wide to long
-deaths = pd.melt(deaths, id_vars=['country', 'year'], value_vars=['15 to 49', '50 to 69', 'Above 70'], var_name='Age')
-factors = pd.melt(factors, id_vars=['country', 'year'], value_vars=['Diet low in vegetables',
-                        'Diet low in nuts and seeds',
-                        'Diet low in calcium',
-                        'Unsafe sex',
-                        'No access to handwashing facility',
-                        'Child wasting',
-                        'Child stunting',
-                        'Diet high in red meat',
-                        'Diet low in fiber',
-                        'Diet low in seafood omega-3 fatty acids',
-                        'Diet high in sodium',
-                        'Low physical activity',
-                        'Non-exclusive breastfeeding',
-                        'Discontinued breastfeeding',
-                        'Iron deficiency',
-                        'Vitamin A deficiency',
-                        'Zinc deficiency',
-                        'Smoking',
-                        'Secondhand smoke',
-                        'Alcohol use',
-                        'Drug use',
-                        'High fasting plasma glucose',
-                        'High total cholesterol', # Many null values
-                        'High systolic blood pressure',
-                        'High body-mass index',
-                        'Low bone mineral density',
-                        'Diet low in fruits',
-                        'Diet low in legumes',
-                        'Low birth weight for gestation',
-                        'Unsafe water source',
-                        'Unsafe sanitation',
-                        'Household air pollution from solid fuels',
-                        'Air pollution',
-                        'Outdoor air pollution'], var_name='Risk Factor')
+deaths = pd.melt(deaths, id_vars=['country', 'year'], value_vars=loaders.AGE_GROUPS, var_name='Age')
+factors = pd.melt(factors, id_vars=['country', 'year'], value_vars=loaders.RISK_FACTORS, var_name='Risk Factor')
 
 # Country Selection
 countries = deaths['country'].unique() # get unique country names
@@ -0,0 +1,194 @@
+"""Embedded SQLite store of the datasets in data/.
+
+An optional alternative to keeping every table as a pandas frame in each
+worker: the five CSV files are loaded once into a local SQLite database,
+indexed on country/code and year, which the workers then query for just the
+rows a view needs. The joined control policy / deaths table is a view.
+
+The store is (re)built from the CSVs by ``ensure`` when it is missing or holds
+another version of one of them: ``store_sources`` records the signature of
+each file as built, or as last applied by refresh.py. The build writes to a temporary file that replaces the
+store atomically, so workers never read a half-built database.
+
+Usage:
+    python sql_store.py [--path data/tobacco.sqlite]
+"""
+import os
+import sys
+import sqlite3
+import argparse
+import tempfile
+import threading
+
+import datasets
+
+
+SQL_PATH = os.environ.get('TOBACCO_SQL_PATH', os.path.join(datasets.DATA_DIR, 'tobacco.sqlite'))
+
+# table -> dataset of the registry, stored with the columns of its 'store' view
+TABLES = datasets.DATASETS
+
+SOURCES = [dataset.path for dataset in TABLES.values()]
+
+CONTROL_DEATHS_VIEW = '''
+CREATE VIEW control_policy_deaths AS
+SELECT p.*, d."Code" AS "Code", d."deaths" AS "deaths"
+FROM control_policy AS p
+LEFT JOIN control_deaths AS d ON d."ID" = p."ID"
+'''
+
+# Incremental refreshes applied to the store (see refresh.py), so every worker
+# knows which countries changed even when another worker applied the rows
+REFRESH_LOG_TABLE = '''
+CREATE TABLE IF NOT EXISTS refresh_log (
+    "table" TEXT NOT NULL,
+    "signature" TEXT NOT NULL,
+    "countries" TEXT NOT NULL,
+    "years" TEXT NOT NULL,
+    PRIMARY KEY ("table", "signature")
+)
+'''
+
+
+# Version of each source file the store holds (see ``signature``)
+SOURCES_TABLE = '''
+CREATE TABLE IF NOT EXISTS store_sources (
+    "table" TEXT PRIMARY KEY,
+    "signature" TEXT NOT NULL
+)
+'''
+
+RECORD_SOURCE = 'INSERT OR REPLACE INTO store_sources VALUES (?, ?)'
+
+
+def quote(name):
+    return '"%s"' % name.replace('"', '""')
+
+
+def signature(path):
+    """Identifies one version of a file, the same in every worker."""
+    stat = os.stat(path)
+    return '%d:%d' % (stat.st_mtime_ns, stat.st_size)
+
+
+def build(path=SQL_PATH, frames=None):
+    """Write every table, its indexes and the joined view to a new database at ``path``.
+
+    ``frames`` maps table names to DataFrames; the other tables are parsed
+    from their files one at a time, not through the cached loaders, so a
+    worker building the store does not keep the whole tables in memory.
+    """
+    frames = frames or {}
+    # A temporary file of this build only: workers starting together each build their
+    # own and the last replace wins, every version being complete
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    try:
+        connection = sqlite3.connect(tmp_path)
+        try:
+            # Readers keep reading while refresh.py writes
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(SOURCES_TABLE)
+            for table, dataset in TABLES.items():
+                columns = dataset.view('store')
+                # Taken before reading: a file changing meanwhile leaves the store stale
+                if os.path.exists(dataset.path):
+                    connection.execute(RECORD_SOURCE, (table, signature(dataset.path)))
+                frame = frames[table] if table in frames else datasets.read(dataset, columns)
+                frame.loc[:, columns].to_sql(table, connection, index=False, chunksize=50000)
+                del frame
+                for indexed in [dataset.keys, [dataset.year]] + [[key] for key in dataset.indexed]:
+                    connection.execute('CREATE INDEX %s ON %s (%s)' % (
+                        quote('ix_%s_%s' % (table, '_'.join(indexed))), table,
+                        ', '.join(quote(column) for column in indexed)))
+            connection.execute(CONTROL_DEATHS_VIEW)
+            connection.execute(REFRESH_LOG_TABLE)
+            connection.execute('ANALYZE')
+            connection.commit()
+        finally:
+            connection.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        for leftover in (tmp_path, tmp_path + '-wal', tmp_path + '-shm'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+    return path
+
+
+def is_stale(path=SQL_PATH):
+    """Whether the store is missing or does not hold the current version of every source file."""
+    if not os.path.exists(path):
+        return True
+    connection = sqlite3.connect('file:%s?mode=ro' % path, uri=True)
+    try:
+        stored = dict(connection.execute('SELECT "table", signature FROM store_sources'))
+    except sqlite3.OperationalError:
+        # A store built before store_sources existed
+        return True
+    finally:
+        connection.close()
+    return any(stored.get(table) != signature(dataset.path)
+               for table, dataset in TABLES.items() if os.path.exists(dataset.path))
+
+
+def record_source(table, version, path=SQL_PATH):
+    """Mark the store as holding ``version`` of ``table``'s file, unchanged from the one it holds."""
+    connection = connect_writable(path)
+    try:
+        connection.execute(SOURCES_TABLE)
+        connection.execute(RECORD_SOURCE, (table, version))
+    finally:
+        connection.close()
+
+
+_build_lock = threading.Lock()
+
+
+def ensure(path=SQL_PATH):
+    """Path of an up-to-date store, building it first if needed."""
+    with _build_lock:
+        if is_stale(path):
+            build(path)
+    return path
+
+
+_local = threading.local()
+
+
+def connect(path=SQL_PATH):
+    """Read-only connection of the calling thread (SQLite connections are per thread).
+
+    Reopened when ``build`` has replaced the file since.
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    inode = os.stat(path).st_ino
+    connection, opened_inode = connections.get(path, (None, None))
+    if opened_inode != inode:
+        if connection is not None:
+            connection.close()
+        connection = sqlite3.connect('file:%s?mode=ro' % path, uri=True)
+        connections[path] = (connection, inode)
+    return connection
+
+
+def connect_writable(path=SQL_PATH):
+    """New read-write connection, for refresh.py (the caller closes it)."""
+    return sqlite3.connect(path, timeout=30, isolation_level=None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the SQLite store of the tobacco datasets.')
+    parser.add_argument('--path', default=SQL_PATH)
+    args = parser.parse_args(argv)
+
+    build(args.path)
+    print('Built %s (%.1f MB)' % (args.path, os.path.getsize(args.path) / 1e6))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""Cold-start helpers: deferred imports and an import-time report.
+
+pandas, numpy, altair (with its jsonschema validation) and streamlit dominate
+process start. ``lazy_import`` returns a module whose body only runs on first
+attribute access, so importing the dashboard's modules (main.py's own module
+graph, shared by query_api.py, refresh.py, export.py and the other tools)
+costs almost nothing until something touches pandas or altair. Set
+``TOBACCO_LAZY_IMPORTS=0`` to import everything eagerly again.
+
+Streamlit 0.72 imports pandas and altair itself, and ``streamlit run`` imports
+Streamlit before main.py, so inside the dashboard server both are loaded
+before the script starts: the deferral pays off for the tools and for
+main.py's own modules, not for the first Streamlit page.
+
+Usage:
+    python startup.py report                  # per-module import times
+    python startup.py check --budget 3.0      # exit 1 if cold start is over budget
+"""
+import os
+import re
+import ast
+import sys
+import time
+import argparse
+import importlib
+import threading
+import types
+import importlib.util
+import subprocess
+
+
+LAZY_IMPORTS = os.environ.get('TOBACCO_LAZY_IMPORTS', '1') != '0'
+
+# Already imported by the ``streamlit run`` server before main.py starts
+PRELOADED_MODULES = ['streamlit']
+
+# Libraries the dashboard modules should only load on first use
+HEAVY_MODULES = ['pandas', 'numpy', 'altair']
+
+# Cold start budget in seconds for importing dashboard_modules() in a fresh interpreter
+COLD_START_BUDGET = float(os.environ.get('TOBACCO_COLD_START_BUDGET', 5.0))
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s*(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)')
+
+
+# Held while a lazy module runs its body, so a module first touched by two
+# threads at once is loaded once and never seen half-initialized (importlib's
+# LazyLoader marks the module loaded before running its body)
+_load_lock = threading.RLock()
+_loading = set()
+
+
+class _LazyModule(types.ModuleType):
+    """Module whose body runs on first attribute access, then a plain module."""
+
+    def __getattribute__(self, attr):
+        get = types.ModuleType.__getattribute__
+        with _load_lock:
+            # Attributes read while the body runs (by the module's own imports) are served as is
+            if type(self) is _LazyModule and id(self) not in _loading:
+                _loading.add(id(self))
+                try:
+                    spec = get(self, '__spec__')
+                    spec.loader.exec_module(self)
+                    self.__class__ = types.ModuleType
+                finally:
+                    _loading.discard(id(self))
+        return get(self, attr)
+
+
+def is_lazy(module):
+    """Whether ``module`` was lazily imported and has not run its body yet."""
+    return type(module) is _LazyModule
+
+
+def lazy_import(name):
+    """Import ``name`` now if lazy imports are off, on first attribute access otherwise."""
+    if name in sys.modules:
+        # Not import_module: it reads __spec__, which loads a module still lazy
+        return sys.modules[name]
+    if not LAZY_IMPORTS:
+        return importlib.import_module(name)
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError("No module named '%s'" % name, name=name)
+    module = importlib.util.module_from_spec(spec)
+    module.__class__ = _LazyModule
+    sys.modules[name] = module
+    return module
+
+
+####### Import-time report
+
+def dashboard_modules(script=os.path.join(HERE, 'main.py')):
+    """Modules imported at the top level of ``script``, except PRELOADED_MODULES."""
+    with open(script) as f:
+        tree = ast.parse(f.read(), script)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.append(node.module)
+    return [module for module in dict.fromkeys(modules) if module not in PRELOADED_MODULES]
+
+
+def _run(python, args, code, lazy):
+    # Fresh interpreter in the repo, TOBACCO_LAZY_IMPORTS as given (None: as in this process)
+    env = dict(os.environ)
+    if lazy is not None:
+        env['TOBACCO_LAZY_IMPORTS'] = '1' if lazy else '0'
+    return subprocess.run([python] + args + ['-c', code], cwd=HERE, env=env,
+                          stderr=subprocess.PIPE, stdout=subprocess.PIPE,
+                          universal_newlines=True, check=True)
+
+
+def import_times(modules=None, python=sys.executable, lazy=None):
+    """Run ``python -X importtime`` on ``modules`` in a fresh interpreter.
+
+    Returns one dict per imported module with its own (``self_us``) and
+    cumulative (``cumulative_us``) import time in microseconds and its
+    nesting ``depth`` in the import tree.
+    """
+    code = '; '.join('import %s' % module for module in modules or dashboard_modules())
+    result = _run(python, ['-X', 'importtime'], code, lazy)
+    rows = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append({'module': module,
+                         'self_us': int(self_us),
+                         'cumulative_us': int(cumulative_us),
+                         'depth': (len(indent) - 1) // 2})
+    return rows
+
+
+def format_report(rows, top=25):
+    """Table of the ``top`` slowest modules by cumulative import time."""
+    lines = ['%12s %12s  %s' % ('self [ms]', 'cumul. [ms]', 'module')]
+    for row in sorted(rows, key=lambda row: row['cumulative_us'], reverse=True)[:top]:
+        lines.append('%12.1f %12.1f  %s%s' % (row['self_us'] / 1000, row['cumulative_us'] / 1000,
+                                             '  ' * row['depth'], row['module']))
+    total = sum(row['self_us'] for row in rows) / 1000
+    lines.append('%d modules, %.1f ms in total' % (len(rows), total))
+    return '\n'.join(lines)
+
+
+def cold_start_seconds(modules=None, repeat=3, python=sys.executable, lazy=None):
+    """Best wall time over ``repeat`` runs of importing ``modules`` in a fresh interpreter."""
+    code = '; '.join('import %s' % module for module in modules or dashboard_modules())
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _run(python, [], code, lazy)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def loaded_modules(modules=None, python=sys.executable, lazy=None):
+    """Which HEAVY_MODULES importing ``modules`` really loads (lazy ones do not count)."""
+    code = '; '.join(['import sys, startup'] +
+                     ['import %s' % module for module in modules or dashboard_modules()] +
+                     ['print(" ".join(m for m in %r if m in sys.modules and '
+                      'not startup.is_lazy(sys.modules[m])))' % HEAVY_MODULES])
+    return _run(python, [], code, lazy).stdout.split()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import-time report and cold start budget check.')
+    subparsers = parser.add_subparsers(dest='command')
+    report = subparsers.add_parser('report', help='per-module import times')
+    report.add_argument('modules', nargs='*', help="default: main.py's own modules")
+    report.add_argument('--top', type=int, default=25)
+    check = subparsers.add_parser('check', help='fail if cold start is over budget')
+    check.add_argument('modules', nargs='*', help="default: main.py's own modules")
+    check.add_argument('--budget', type=float, default=COLD_START_BUDGET)
+    check.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.command == 'report':
+        print(format_report(import_times(args.modules), top=args.top))
+        return 0
+    if args.command == 'check':
+        elapsed = cold_start_seconds(args.modules, repeat=args.repeat)
+        loaded = loaded_modules(args.modules)
+        print('cold start: %.2f s (budget %.2f s), loaded eagerly: %s' % (
+            elapsed, args.budget, ', '.join(loaded) or 'none'))
+        return 0 if elapsed <= args.budget and (not LAZY_IMPORTS or not loaded) else 1
+    parser.print_help()
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
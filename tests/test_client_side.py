@@ -0,0 +1,56 @@
+import age_stacks
+import client_side
+import compact
+import loaders
+
+
+def test_deaths_payload_keeps_every_year_in_whole_deaths():
+    frames = client_side.deaths_payload(loaders.load_deaths(), loaders.load_factors())
+    # The bars sum the brushed years, as in server mode
+    assert len(frames[1]) == len(loaders.load_factors())
+    assert frames[1].dtypes['Smoking'].kind == 'i'
+    assert client_side.payload_bytes(*frames) == sum(len(compact._to_csv(frame, 6)) for frame in frames)
+
+
+def test_spec_is_only_built_within_the_budget(monkeypatch):
+    frames = (loaders.load_sales().head(10),)
+    spec = {'mark': 'line'}
+    client_side.clear_caches()
+    try:
+        monkeypatch.setattr(client_side, 'CLIENT_SIDE_MAX_BYTES', 10)
+        assert client_side.cached('small', lambda: frames, lambda sales: spec)[2] is None
+        monkeypatch.setattr(client_side, 'CLIENT_SIDE_MAX_BYTES', 10000)
+        client_side.update()
+        assert client_side.cached('small', lambda: frames)[2] == spec
+    finally:
+        client_side.clear_caches()
+
+
+def test_payload_is_built_once_until_updated():
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return (loaders.load_sales().head(len(calls)),)
+
+    client_side.clear_caches()
+    try:
+        first = client_side.cached('test', compute)
+        client_side.cached('test', compute)
+        assert len(calls) == 1
+        client_side.update()
+        frames, size, spec = client_side.cached('test', compute)
+        assert len(calls) == 2 and len(frames[0]) == 2 and size > first[1] and spec is None
+    finally:
+        client_side.clear_caches()
+
+
+def test_client_bands_are_the_server_bands():
+    bands = client_side.deaths_bands(loaders.load_deaths())
+    france = bands[bands['country'] == 'France'].reset_index(drop=True)
+    server, totals = age_stacks.country_stack('France')
+    assert (france['total'] == totals['total'].round().astype('int64')).all()
+    for age in loaders.AGE_GROUPS:
+        rows = server[server['Age'] == age].reset_index(drop=True)
+        for column, name in [('share', age), ('lower', 'lower ' + age), ('upper', 'upper ' + age)]:
+            assert (france[name] - rows[column]).abs().max() <= 0.0005
@@ -0,0 +1,40 @@
+import altair as alt
+import pandas as pd
+
+import compact
+
+
+def _frame():
+    return pd.DataFrame({'Country': ['France', 'France', 'Spain'], 'Year': [1990, 1991, 1990],
+                         'NumCig': [7678.717644361205, 11.60000038146973, 3.0],
+                         'peak': [True, False, True]})
+
+
+def test_booleans_are_written_as_vega_parses_them():
+    csv = compact._to_csv(_frame(), 6)
+    assert csv.splitlines()[1:] == ['France,1990,7678.72,true', 'France,1991,11.6,false', 'Spain,1990,3.0,true']
+    assert compact._csv_format(_frame())['parse']['peak'] == 'boolean'
+
+
+def test_inline_spec_keeps_data_away_from_streamlit():
+    # Streamlit converts top-level datasets and data.values into DataFrames
+    base = alt.Chart(_frame()).encode(x='Year:O', y='NumCig:Q')
+    spec = compact.chart_spec(alt.layer(base.mark_line(), base.mark_point().transform_filter(alt.datum.peak)))
+    assert 'datasets' not in spec and 'data' not in spec
+    view, = spec['vconcat']
+    assert view['data']['format']['type'] == 'csv'
+    assert view['data']['values'].startswith('Country,Year,NumCig,peak\n')
+    assert all('data' not in layer for layer in view['layer'])
+
+
+def test_inline_spec_inlines_each_view_dataset():
+    other = _frame().assign(Year=2000)
+    spec = compact.chart_spec(alt.hconcat(alt.Chart(_frame()).mark_bar().encode(x='Year:O'),
+                                          alt.Chart(other).mark_bar().encode(x='Year:O')))
+    assert 'datasets' not in spec and 'vconcat' not in spec
+    assert [',2000,' in view['data']['values'] for view in spec['hconcat']] == [False, True]
+
+
+def test_inline_spec_leaves_url_data():
+    spec = {'data': {'url': 'data/x.csv'}, 'mark': 'bar'}
+    assert compact.inline_spec(spec) == spec
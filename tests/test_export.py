@@ -0,0 +1,45 @@
+import os
+import sys
+import json
+import shutil
+import subprocess
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Two scatter views are enough to see what a rerun rebuilds
+EXPORT = '''
+import export, control_views
+scatters = [key for key in control_views.all_keys() if key[0] == 'scatter'][:2]
+export.view_keys = lambda with_regions=False: scatters
+manifest = export.export(%r, workers=1)
+print(manifest['exported'], manifest['skipped'])
+'''
+
+
+def _data_copy(tmp_path):
+    data_dir = tmp_path / 'data'
+    shutil.copytree(os.path.join(HERE, 'data'), data_dir,
+                    ignore=lambda path, names: [name for name in names if name.endswith(('.sqlite', '.parquet'))])
+    return data_dir
+
+
+def _export(data_dir, output):
+    env = dict(os.environ, TOBACCO_DATA_DIR=str(data_dir))
+    result = subprocess.run([sys.executable, '-c', EXPORT % str(output)], cwd=HERE, env=env,
+                            capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
+
+def test_rerun_keeps_entries_and_rebuilds_after_a_source_change(tmp_path):
+    data_dir, output = _data_copy(tmp_path), tmp_path / 'export'
+    assert _export(data_dir, output) == '2 0'
+    first = json.loads((output / 'manifest.json').read_text())
+    assert first['complete'] and all(entry['seconds'] for entry in first['views'])
+
+    assert _export(data_dir, output) == '0 2'
+    second = json.loads((output / 'manifest.json').read_text())
+    assert second['views'] == first['views']
+
+    policy = data_dir / 'control_policy.csv'
+    policy.write_text(policy.read_text() + '\n')
+    assert _export(data_dir, output) == '2 0'
@@ -0,0 +1,44 @@
+import ingest
+
+HEADER = ('Entity,Code,Year,'
+          'Deaths - Smoking - Sex: Both - Age: All Ages (Number),'
+          'Deaths - Smoking - Sex: Male - Age: 70+ years (Number),'
+          'Deaths - Alcohol use - Sex: Both - Age: All Ages (Number)\n')
+ROWS = ['France,FRA,2000,10,4,1\n', 'France,FRA,2001,20,5,2\n',
+        'Spain,ESP,2000,30,6,3\n', 'Spain,ESP,2001,40,7,4\n',
+        'Brittany,,2000,2,1,0\n', 'Brittany,,2001,3,1,0\n']
+
+
+def _extract(tmp_path):
+    path = tmp_path / 'extract.csv'
+    path.write_text(HEADER + ''.join(ROWS))
+    return str(path)
+
+
+def test_default_cube_sums_years_out(tmp_path):
+    cube = ingest.stream_risk_factors(_extract(tmp_path), chunksize=2)
+    assert cube.index.names == ingest.DEFAULT_DIMENSIONS
+    assert cube[('France', 'Smoking', 'Both', 'All Ages')] == 30
+    assert cube[('Spain', 'Alcohol use', 'Both', 'All Ages')] == 7
+
+
+def test_chunks_fold_to_the_same_cube(tmp_path):
+    path = _extract(tmp_path)
+    dimensions = ['country', 'year', 'Risk Factor', 'sex']
+    whole = ingest.stream_risk_factors(path, chunksize=100, dimensions=dimensions)
+    chunked = ingest.stream_risk_factors(path, chunksize=1, dimensions=dimensions)
+    assert whole.equals(chunked)
+
+
+def test_sub_national_locations(tmp_path):
+    path = _extract(tmp_path)
+    locations = {'Brittany': 'France'}
+    # Counted by France's own rows
+    by_country = ingest.stream_risk_factors(path, dimensions=['country', 'Risk Factor', 'sex'],
+                                            locations=locations)
+    assert by_country[('France', 'Smoking', 'Both')] == 30
+    assert set(by_country.index.get_level_values('country')) == {'France', 'Spain'}
+    by_location = ingest.stream_risk_factors(path, dimensions=['location', 'country', 'Risk Factor', 'sex'],
+                                             locations=locations)
+    assert by_location[('Brittany', 'France', 'Smoking', 'Both')] == 5
+    assert by_location[('France', 'France', 'Smoking', 'Both')] == 30
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+import lag_correlation
+import loaders
+
+
+def _pandas_correlation(sales, deaths, country, lag):
+    # Sales in year t against deaths in year t + lag, as pandas pairs them
+    x = sales[sales['Country'] == country].set_index('Year')['NumCig']
+    y = deaths[deaths['country'] == country].set_index('year')['total']
+    y.index = y.index - lag
+    return x.corr(y), len(pd.concat([x, y], axis=1).dropna())
+
+
+def test_france_matches_pandas():
+    sales = loaders.load_sales()
+    deaths = lag_correlation.death_totals(loaders.load_deaths())
+    result = lag_correlation.correlate(sales, deaths)
+    row = list(result['country']).index('France')
+    for lag in [0, 5, 20]:
+        expected, pairs = _pandas_correlation(sales, deaths, 'France', lag)
+        assert result['pairs'][row, lag] == pairs
+        assert np.isclose(result['r'][row, lag], expected)
+
+
+def test_ragged_coverage_is_masked_per_country():
+    x = np.array([[1, 2, 3, 4, 5, 6, np.nan, np.nan],
+                  [np.nan, np.nan, 2, 9, 4, 7, 5, 1.0]])
+    y = np.array([[2, 4, 7, 8, 11, 12, 13, 14],
+                  [np.nan, 1, 3, np.nan, 6, 2, 8, 4.0]])
+    lags, r, pairs = lag_correlation.lagged_correlation(x, y, max_lag=2, min_pairs=2)
+    for country in range(2):
+        for lag in lags:
+            pair = pd.DataFrame({'x': x[country, :len(x[country]) - lag], 'y': y[country, lag:]}).dropna()
+            assert pairs[country, lag] == len(pair)
+            assert np.isclose(r[country, lag], pair['x'].corr(pair['y']), equal_nan=True)
+
+
+def test_too_few_pairs_give_no_correlation():
+    x = np.array([[1, 2, 3, np.nan, 5.0]])
+    y = np.array([[2, 1, 4, 3, 6.0]])
+    _, r, pairs = lag_correlation.lagged_correlation(x, y, max_lag=1, min_pairs=4)
+    assert pairs.tolist() == [[4, 3]]
+    assert np.isfinite(r[0, 0]) and np.isnan(r[0, 1])
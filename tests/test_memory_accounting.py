@@ -0,0 +1,28 @@
+import tracemalloc
+
+import memory_accounting
+
+
+def test_overlapping_accounts_keep_tracing_until_the_last_stops():
+    assert not tracemalloc.is_tracing()
+    first = memory_accounting.MemoryAccount(enabled=True).start()
+    second = memory_accounting.MemoryAccount(enabled=True).start()
+    first.checkpoint('rerun')
+    first.stop()
+    assert tracemalloc.is_tracing()
+    data = [bytearray(1000) for _ in range(100)]
+    second.checkpoint('rerun')
+    second.stop()
+    assert not tracemalloc.is_tracing()
+    assert first.report()['overlapped'] and second.report()['overlapped']
+    assert second.report()['stages'][0]['allocated_bytes'] >= 100000
+    del data
+
+
+def test_account_alone_is_not_overlapped():
+    account = memory_accounting.MemoryAccount(enabled=True).start()
+    account.checkpoint('rerun')
+    report = account.stop().report()
+    assert not report['overlapped'] and not tracemalloc.is_tracing()
+    # A second stop does nothing
+    account.stop()
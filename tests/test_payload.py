@@ -0,0 +1,80 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+import compact
+import payload
+
+
+def _guard_within(seconds, *args, **kwargs):
+    # Run guard in a thread so that a regression fails the test instead of hanging it
+    result = []
+    thread = threading.Thread(target=lambda: result.append(payload.guard(*args, **kwargs)), daemon=True)
+    thread.start()
+    thread.join(seconds)
+    assert result, 'guard did not return within %s s' % seconds
+    return result[0]
+
+
+def test_frame_under_budget_is_unchanged():
+    frame = pd.DataFrame({'g': ['a'] * 10, 'v': np.arange(10.0)})
+    assert payload.guard('x', frame, group='g', max_bytes=10 ** 6) is frame
+
+
+def test_downsample_keeps_every_group_when_it_fits():
+    frame = pd.DataFrame({'g': np.repeat(['a', 'b', 'c'], 1000), 'v': np.arange(3000.0)})
+    reduced = _guard_within(10, 'x', frame, group='g', max_bytes=20000)
+    assert payload.estimate_bytes(reduced) <= 20000
+    assert set(reduced['g']) == {'a', 'b', 'c'}
+    # First and last rows of each group are kept
+    assert {0.0, 999.0, 1000.0, 1999.0, 2000.0, 2999.0} <= set(reduced['v'])
+
+
+def test_groups_over_budget_drop_whole_groups():
+    # 2000 groups of 10 rows: their first and last rows alone are over the budget
+    frame = pd.DataFrame({'g': np.repeat(np.arange(2000), 10), 'v': np.arange(20000.0)})
+    reduced = _guard_within(10, 'x', frame, group='g', max_bytes=20000)
+    assert 0 < len(reduced) < len(frame)
+    assert payload.estimate_bytes(reduced) <= 20000
+    # The groups left are whole groups of the downsampled frame, not a row sample
+    assert (reduced.groupby('g').size() <= 2).all()
+
+
+def test_multi_column_groups_over_budget():
+    frame = pd.DataFrame({'country': np.repeat(np.arange(400), 40),
+                          'factor': np.tile(np.repeat(np.arange(20), 2), 400),
+                          'value': np.arange(16000.0)})
+    reduced = _guard_within(10, 'x', frame, group=['country', 'factor'], max_bytes=5000)
+    assert 0 < len(reduced)
+    assert payload.estimate_bytes(reduced) <= 5000
+
+
+def test_single_rows_over_budget_without_groups():
+    frame = pd.DataFrame({'v': np.arange(5000.0)})
+    reduced = _guard_within(10, 'x', frame, max_bytes=50)
+    assert 1 <= len(reduced) <= 5
+
+
+def test_summed_measures_drop_whole_groups_with_a_notice():
+    frame = pd.DataFrame({'factor': np.repeat(['a', 'b', 'c', 'd'], 500), 'value': np.arange(2000.0)})
+    notices = []
+    reduced = _guard_within(10, 'Bars', frame, group='factor', max_bytes=6000, sample=False, notices=notices)
+    # Every row of the groups kept, so their sums are exact
+    assert set(reduced.groupby('factor').size()) == {500}
+    assert len(notices) == 1 and notices[0].startswith('Bars: ') and 'd' in notices[0].split('shown: ')[1]
+
+
+def test_exact_reduction_and_its_notice():
+    frame = pd.DataFrame({'g': np.repeat(['a', 'b'], 1000), 'v': np.arange(2000.0)})
+    notices = []
+    reduced = payload.guard('x', frame, reductions=[
+        ('totals', lambda frame: frame.groupby('g', as_index=False)['v'].sum(), 'Totals only.')],
+        group='g', max_bytes=1000, sample=False, notices=notices)
+    assert reduced['v'].tolist() == [frame['v'][:1000].sum(), frame['v'][1000:].sum()]
+    assert notices == ['Totals only.']
+
+
+def test_estimate_is_the_shipped_csv():
+    frame = pd.DataFrame({'g': ['a'] * 10, 'v': np.arange(10.0) / 3})
+    assert payload.estimate_bytes(frame) == compact.csv_bytes(frame) < len(frame.to_json(orient='records'))
@@ -0,0 +1,22 @@
+import threading
+
+import pytest
+
+import progressive
+
+
+def test_inline_sections_run_on_the_submitting_thread():
+    sections = progressive.Sections(progressive.InlineExecutor())
+    threads, shown = [], []
+    sections.submit(lambda: threads.append(threading.current_thread()) or 1, then=shown.append)
+    # The work is done by submit, the callback waits for run
+    assert threads == [threading.current_thread()] and shown == []
+    sections.run()
+    assert shown == [1]
+
+
+def test_inline_error_is_raised_by_run():
+    sections = progressive.Sections(progressive.InlineExecutor())
+    sections.submit(lambda: 1 / 0, then=print)
+    with pytest.raises(ZeroDivisionError):
+        sections.run()
@@ -0,0 +1,52 @@
+import os
+import sys
+import json
+import shutil
+import subprocess
+
+import query_api
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CODE = '''
+import json, loaders, query_api
+bodies = [query_api.respond(*path.split('?'))[2].decode() for path in query_api.BENCH_PATHS]
+print(json.dumps([bodies, [load.__name__ for load in loaders.LOADERS.values() if load.is_loaded()]]))
+'''
+
+
+def _responses(backend, data_dir):
+    env = dict(os.environ, TOBACCO_BACKEND=backend, TOBACCO_DATA_DIR=str(data_dir))
+    result = subprocess.run([sys.executable, '-c', CODE], cwd=HERE, env=env,
+                            capture_output=True, text=True, check=True)
+    return result.stdout
+
+
+def test_sqlite_backend_answers_from_the_store(tmp_path):
+    data_dir = tmp_path / 'data'
+    shutil.copytree(os.path.join(HERE, 'data'), data_dir,
+                    ignore=lambda directory, names: [name for name in names if not name.endswith('.csv')])
+    pandas_bodies, _ = json.loads(_responses('pandas', data_dir))
+    sqlite_bodies, loaded = json.loads(_responses('sqlite', data_dir))
+    assert loaded == []
+    assert sqlite_bodies == pandas_bodies
+
+
+def test_response_computed_across_a_refresh_is_not_cached(monkeypatch):
+    path, query = '/countries', 'dataset=sales'
+    compute = query_api._compute
+
+    def compute_then_refresh(*args):
+        entry = compute(*args)
+        # The data changes while this request computes: invalidate does not see its key yet
+        query_api.invalidate('sales', {'France'}, {2000})
+        return entry
+
+    query_api.response_cache.clear()
+    monkeypatch.setattr(query_api, '_compute', compute_then_refresh)
+    query_api.respond(path, query)
+    assert (path, query) not in query_api.response_cache.keys()
+    monkeypatch.setattr(query_api, '_compute', compute)
+    query_api.respond(path, query)
+    assert (path, query) in query_api.response_cache.keys()
+    query_api.response_cache.clear()
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+import loaders
+import sales_trends
+
+
+def _pandas_trends(sales, window):
+    # Every country on a full year range, so that missing years are gaps
+    rows = []
+    for country, group in sales.groupby('Country'):
+        series = group.set_index('Year')['NumCig']
+        full = series.reindex(range(series.index.min(), series.index.max() + 1))
+        rows.append(pd.DataFrame({'Country': country, 'Year': series.index,
+                                  'smoothed': full.rolling(window, min_periods=1).mean()[series.index].to_numpy(),
+                                  'yoy': full.diff()[series.index].to_numpy()}))
+    return pd.concat(rows, ignore_index=True)
+
+
+def test_matches_pandas_rolling_and_diff():
+    sales = loaders.load_sales()
+    table = sales_trends.trend_table(sales)
+    expected = _pandas_trends(sales, sales_trends.ROLLING_YEARS)
+    assert table[['Country', 'Year']].equals(expected[['Country', 'Year']])
+    for column in ['smoothed', 'yoy']:
+        assert np.allclose(table[column], expected[column].round(sales_trends.DECIMALS), equal_nan=True)
+
+
+def test_gap_years():
+    sales = pd.DataFrame({'Country': ['A'] * 4, 'Year': [2000, 2001, 2004, 2005],
+                          'NumCig': [1.0, 3.0, 5.0, 9.0]})
+    table = sales_trends.trend_table(sales, window=3)
+    # 2004 has no previous year, and its window (2002-2004) holds no other row
+    assert np.allclose(table['yoy'], [np.nan, 2.0, np.nan, 4.0], equal_nan=True)
+    assert table['smoothed'].tolist() == [1.0, 2.0, 5.0, 7.0]
+
+
+def test_tied_peak_marks_the_first_year():
+    sales = pd.DataFrame({'Country': ['A'] * 4 + ['B'] * 2, 'Year': [2000, 2001, 2002, 2003, 2000, 2001],
+                          'NumCig': [2.0, 7.0, np.nan, 7.0, 4.0, 4.0]})
+    table = sales_trends.trend_table(sales)
+    assert table['peak'].tolist() == [False, True, False, False, True, False]
@@ -0,0 +1,72 @@
+import os
+import sys
+import shutil
+import subprocess
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run(data_dir, code):
+    # The data paths are read at import: each check runs in its own interpreter
+    env = dict(os.environ, TOBACCO_DATA_DIR=str(data_dir))
+    result = subprocess.run([sys.executable, '-c', code], cwd=HERE, env=env,
+                            capture_output=True, text=True, check=True)
+    return result.stdout.strip()
+
+
+def _data_copy(tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    for name in os.listdir(os.path.join(HERE, 'data')):
+        if name.endswith('.csv'):
+            shutil.copy(os.path.join(HERE, 'data', name), data_dir / name)
+    return data_dir
+
+
+def test_store_stays_current_after_incremental_refresh(tmp_path):
+    data_dir = _data_copy(tmp_path)
+    assert _run(data_dir, 'import sql_store; sql_store.build(); print(sql_store.is_stale())') == 'False'
+
+    sales = data_dir / 'sales-of-cigarettes-per-adult-per-day.csv'
+    lines = sales.read_text().splitlines(keepends=True)
+    lines[1] = lines[1].replace(',12\n', ',13\n')
+    sales.write_text(''.join(lines))
+    assert _run(data_dir, 'import sql_store; print(sql_store.is_stale())') == 'True'
+
+    code = ('import refresh, sql_store; changes = refresh.refresh("sales"); '
+            'print(len(changes.upserts), sql_store.is_stale())')
+    assert _run(data_dir, code) == '1 False'
+
+
+def test_touched_file_with_same_rows_leaves_store_current(tmp_path):
+    data_dir = _data_copy(tmp_path)
+    _run(data_dir, 'import sql_store; sql_store.build()')
+    os.utime(data_dir / 'control_policy.csv')
+    code = 'import refresh, sql_store; refresh.refresh("control_policy"); print(sql_store.is_stale())'
+    assert _run(data_dir, code) == 'False'
+
+
+def test_refresh_of_a_loaded_frame_writes_whole_store_rows(tmp_path):
+    data_dir = _data_copy(tmp_path)
+    _run(data_dir, 'import sql_store; sql_store.build()')
+    sales = data_dir / 'sales-of-cigarettes-per-adult-per-day.csv'
+    lines = sales.read_text().splitlines(keepends=True)
+    code = '''
+import sys, loaders, refresh, sql_store
+loaders.load_sales()
+print('loaded', flush=True)
+sys.stdin.read()
+changes = refresh.refresh("sales")
+row = sql_store.connect().execute(
+    'SELECT "Code", "NumCig" FROM sales WHERE "Country" = ? AND "Year" = ?', ("Armenia", 1988)).fetchone()
+print(len(changes.upserts), row, list(loaders.load_sales().columns))
+'''
+    env = dict(os.environ, TOBACCO_DATA_DIR=str(data_dir))
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=HERE, env=env, text=True,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    # Change the file once the frame is loaded
+    assert process.stdout.readline().strip() == 'loaded'
+    lines[1] = lines[1].replace(',12\n', ',13\n')
+    sales.write_text(''.join(lines))
+    output, _ = process.communicate('')
+    assert output.strip() == "1 ('ARM', 13.0) ['Country', 'Year', 'NumCig']"
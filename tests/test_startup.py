@@ -0,0 +1,46 @@
+import startup
+
+
+def test_dashboard_modules_are_mains_own_imports():
+    modules = startup.dashboard_modules()
+    assert 'loaders' in modules and 'repository' in modules
+    assert 'streamlit' not in modules
+
+
+def test_dashboard_modules_defer_heavy_imports():
+    assert startup.loaded_modules(lazy=True) == []
+
+
+def test_eager_mode_honors_the_environment():
+    assert startup.loaded_modules(lazy=False) == startup.HEAVY_MODULES
+
+
+def test_lazy_module_imported_twice_stays_lazy():
+    # A second lazy_import of a module still lazy must not load it
+    code = ('import sys, startup; startup.lazy_import("colorsys"); startup.lazy_import("colorsys"); '
+            'print(startup.is_lazy(sys.modules["colorsys"]))')
+    assert startup._run(startup.sys.executable, [], code, lazy=True).stdout.strip() == 'True'
+
+
+def test_cold_start_under_budget():
+    assert startup.cold_start_seconds(repeat=1, lazy=True) <= startup.COLD_START_BUDGET
+
+
+def test_lazy_module_loads_once_across_threads():
+    # Two threads touching a lazy module first at the same time both see it loaded
+    code = '''
+import threading, startup
+pd = startup.lazy_import("pandas")
+alt = startup.lazy_import("altair")
+errors = []
+def touch(module, attr):
+    try:
+        getattr(module, attr)
+    except Exception as error:
+        errors.append(repr(error))
+threads = [threading.Thread(target=touch, args=args) for args in [(alt, "Chart"), (pd, "DataFrame"), (alt, "topo_feature")]]
+[thread.start() for thread in threads]
+[thread.join() for thread in threads]
+print(errors)
+'''
+    assert startup._run(startup.sys.executable, [], code, lazy=True).stdout.strip() == '[]'
@@ -1,11 +1,7 @@
 import streamlit as st
-import pandas as pd
 import altair as alt
-import json
-import requests
-import numpy as np
-from IPython.display import display, HTML
-from altair import datum
+
+import regions
 
 
 
@@ -42,6 +38,7 @@ container_map = st.beta_container()
 with container_map:
 
     cols = st.selectbox('Select control measure: ', control_metrics)
+    select_region = st.selectbox('Select WHO region: ', ['World'] + list(regions.WHO_REGIONS))
     
     if cols in control_metrics:   
         metric_to_show_in_covid_Layer = cols +":Q"
@@ -65,11 +62,18 @@ with container_map:
 
 
 url_topojson = 'https://raw.githubusercontent.com/JulioCandela1993/VisualAnalytics/master/world-countries.json'
-data_topojson_remote = alt.topo_feature(url=url_topojson, feature='countries1')
+if select_region == 'World':
+    data_topojson = alt.topo_feature(url=url_topojson, feature='countries1')
+else:
+    # Only the features of the selected region are shipped and projected. Named inline
+    # data stays in the layers: Streamlit replaces the spec's top-level datasets
+    data_topojson = alt.InlineData(values=regions.region_topology(select_region),
+                                   format=alt.DataFormat(type='topojson', feature='countries1'),
+                                   name='region-' + select_region)
 
 select_year = st.slider('Select period: ', 2008, 2018, 2008, step = 2)
 
-map_geojson = alt.Chart(data_topojson_remote).mark_geoshape(
+map_geojson = alt.Chart(data_topojson).mark_geoshape(
     stroke="black",
     strokeWidth=1,
     fill='lightgray'
@@ -83,7 +87,7 @@ map_geojson = alt.Chart(data_topojson_remote).mark_geoshape(
     height=400
 )
       
-choro = alt.Chart(data_topojson_remote).mark_geoshape(
+choro = alt.Chart(data_topojson).mark_geoshape(
     stroke='black'
 ).encode(
     color=metric_to_show_in_covid_Layer,
@@ -114,8 +118,22 @@ choro = alt.Chart(data_topojson_remote).mark_geoshape(
     alt.FieldEqualPredicate(field='year', equal=select_year)
 )
 
+map_layers = map_geojson + choro
+if select_region != 'World':
+    # Low-detail outline of the world behind the region, projection fitted to the region
+    world_outline = alt.Chart(alt.InlineData(values=regions.world_outline(),
+                                             format=alt.DataFormat(type='topojson', feature='countries1'),
+                                             name='world-outline')
+    ).mark_geoshape(
+        fill='#EEEEEE',
+        stroke='white',
+        strokeWidth=0.5,
+        clip=True
+    )
+    map_layers = (world_outline + map_layers).project(**regions.region_projection(select_region, 800, 400))
+
 with container_map:
-    st.altair_chart(map_geojson + choro)
+    st.altair_chart(map_layers)
 
 
 
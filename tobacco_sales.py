@@ -1,20 +1,9 @@
 import altair as alt
 import streamlit as st
-import pandas as pd
-import numpy as np
 
-sales_data = pd.read_csv('data/sales-of-cigarettes-per-adult-per-day.csv',
-                    header=0,
-                    names=[
-                        'Country',
-                        'Code',
-                        'Year',
-                        'NumCig'
-                    ],
-                    dtype={'Country': str,
-                            'Code': str,
-                            'Year': 'Int64',
-                            'NumCig': 'float64'})
+import loaders
+
+sales_data = loaders.load_sales()
 
 sales_minyear = sales_data.loc[:, 'Year'].min()
 sales_maxyear = sales_data.loc[:, 'Year'].max()